@@ -11,6 +11,11 @@ const HUMIDITY_CHAR_UUID = 0x2a6f;
 const BATT_SVC_UUID = 0x180f;
 const BATT_LEVEL_CHAR_UUID = 0x2a19;
 const CALIB_CHAR_UUID = 0x2b00; // Custom UUID for calibration
+const RECORD_CHAR_UUID = "4e41524d-4930-3030-0000-000000000001"; // Packed sensor record
+const RECORD_VERSION = 1;
+const RECORD_SIZE = 19; // bytes per record, src/app/record.py
+const RECORD_FLAG_BACKLOG = 0x01; // reading taken while no central was connected
+const HISTORY_MAX = 1000; // backlog records kept in localStorage
 
 export const BLEProvider = ({ children }) => {
     const [device, setDevice] = useState(null);
@@ -22,6 +27,7 @@ export const BLEProvider = ({ children }) => {
     const [humidity, setHumidity] = useState(null);
     const [batteryLevel, setBatteryLevel] = useState(null);
     const [calibCharacteristic, setCalibCharacteristic] = useState(null);
+    const [history, setHistory] = useState(() => JSON.parse(localStorage.getItem("record_history") || "[]"));
 
     const registerBackgroundSync = async () => {
         try {
@@ -161,6 +167,63 @@ export const BLEProvider = ({ children }) => {
                 setLastReceived(timestamp);
             });
 
+            // Packed record carries every field of one reading in a single indication
+            try {
+                const recordCharacteristic = await envService.getCharacteristic(RECORD_CHAR_UUID);
+                await recordCharacteristic.startNotifications();
+                recordCharacteristic.addEventListener("characteristicvaluechanged", (event) => {
+                    const value = event.target.value;
+                    // backlog indications carry as many records back to back as the ATT MTU allows
+                    for (let offset = 0; offset + RECORD_SIZE <= value.byteLength; offset += RECORD_SIZE) {
+                        if (value.getUint8(offset) !== RECORD_VERSION) {
+                            console.log("Unsupported record version:", value.getUint8(offset));
+                            return;
+                        }
+                        const flags = value.getUint8(offset + 1);
+                        const seq = value.getUint16(offset + 2, true);
+                        const deviceTime = value.getUint32(offset + 4, true);
+                        const rawTemp = value.getInt16(offset + 8, true);
+                        const rawHumid = value.getUint16(offset + 10, true);
+                        const dist = value.getUint16(offset + 12, true) / 10; // Convert mm to cm
+                        const level = value.getUint8(offset + 14);
+                        const intervalMs = value.getUint32(offset + 15, true);
+                        const timestamp = new Date().toLocaleString();
+
+                        const data = {
+                            seq,
+                            deviceTime,
+                            temperature: rawTemp === 0x7fff ? null : rawTemp / 100,
+                            humidity: rawHumid === 0xffff ? null : rawHumid / 100,
+                            distance: dist,
+                            batteryLevel: level === 0xff ? null : level,
+                            interval: intervalMs,
+                            timestamp,
+                        };
+                        if (flags & RECORD_FLAG_BACKLOG) {
+                            // an older reading the device buffered while disconnected, not the current one
+                            console.log("Received backlog record:", data);
+                            setHistory((prev) => {
+                                const next = [...prev, data].slice(-HISTORY_MAX);
+                                localStorage.setItem("record_history", JSON.stringify(next));
+                                return next;
+                            });
+                            continue;
+                        }
+                        localStorage.setItem("latest_record", JSON.stringify(data));
+
+                        console.log("Received record:", data);
+                        if (data.temperature !== null) setTemperature(data.temperature);
+                        if (data.humidity !== null) setHumidity(data.humidity);
+                        setDistance(dist);
+                        if (data.batteryLevel !== null) setBatteryLevel(data.batteryLevel);
+                        setInterval(intervalMs);
+                        setLastReceived(timestamp);
+                    }
+                });
+            } catch (error) {
+                console.log("Record characteristic not available, using per-field characteristics");
+            }
+
             // Get calibration characteristic
             console.log("Getting Calibration Characteristic...");
             const calibCharacteristic = await envService.getCharacteristic(CALIB_CHAR_UUID);
@@ -230,6 +293,7 @@ export const BLEProvider = ({ children }) => {
                 lastReceived, // Add last received to context value
                 humidity,
                 batteryLevel,
+                history, // Backlog records, oldest first
                 connectToDevice,
                 disconnect,
                 writeCalibration,
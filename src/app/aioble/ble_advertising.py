@@ -22,12 +22,13 @@ _ADV_TYPE_UUID16_MORE = const(0x2)
 _ADV_TYPE_UUID32_MORE = const(0x4)
 _ADV_TYPE_UUID128_MORE = const(0x6)
 _ADV_TYPE_APPEARANCE = const(0x19)
+_ADV_TYPE_MANUFACTURER = const(0xFF)
 
 _ADV_MAX_PAYLOAD = const(31)
 
 
 # Generate a payload to be passed to gap_advertise(adv_data=...).
-def advertising_payload(limited_disc=False, br_edr=False, name=None, services=None, appearance=0):
+def advertising_payload(limited_disc=False, br_edr=False, name=None, services=None, appearance=0, manufacturer=None):
     payload = bytearray()
 
     def _append(adv_type, value):
@@ -56,6 +57,10 @@ def advertising_payload(limited_disc=False, br_edr=False, name=None, services=No
     if appearance:
         _append(_ADV_TYPE_APPEARANCE, struct.pack("<h", appearance))
 
+    # (company id, data), like aioble.advertise(manufacturer=...)
+    if manufacturer:
+        _append(_ADV_TYPE_MANUFACTURER, struct.pack("<H", manufacturer[0]) + manufacturer[1])
+
     if len(payload) > _ADV_MAX_PAYLOAD:
         raise ValueError("advertising payload too large")
 
@@ -77,6 +82,12 @@ def decode_name(payload):
     return str(n[0], "utf-8") if n else ""
 
 
+def decode_manufacturer(payload):
+    """Returns (company id, data) of the first manufacturer specific field, or None"""
+    m = decode_field(payload, _ADV_TYPE_MANUFACTURER)
+    return (struct.unpack_from("<H", m[0], 0)[0], m[0][2:]) if m else None
+
+
 def decode_services(payload):
     services = []
     for u in decode_field(payload, _ADV_TYPE_UUID16_COMPLETE):
@@ -6,7 +6,7 @@ from micropython import const
 import bluetooth
 import struct
 
-import uasyncio as ayncio
+import uasyncio as asyncio
 
 from .core import (
     ensure_active,
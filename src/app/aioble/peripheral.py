@@ -6,7 +6,7 @@ from micropython import const
 import bluetooth
 import struct
 
-import uasyncio as ayncio
+import uasyncio as asyncio
 
 from .core import (
     ensure_active,
@@ -53,8 +53,10 @@ def _peripheral_irq(event, data):
         _incoming_connection._conn_handle = conn_handle
         DeviceConnection._connected[conn_handle] = _incoming_connection
 
-        # Signal advertise() to return the connected device.
-        _connect_event.set()
+        # Signal advertise() to return the connected device. The advertisement
+        # may have been started before advertise() was first awaited.
+        if _connect_event:
+            _connect_event.set()
 
     elif event == _IRQ_CENTRAL_DISCONNECT:
         conn_handle, _, _ = data
@@ -153,7 +155,12 @@ async def advertise(
             )
 
     _connect_event = _connect_event or asyncio.ThreadSafeFlag()
-    ble.gap_advertise(interval_us, adv_data=adv_data, resp_data=resp_data, connectable=connectable)
+    if _incoming_connection:
+        # A central already connected to an advertisement started directly
+        # with gap_advertise, return it rather than advertising again.
+        _connect_event.set()
+    else:
+        ble.gap_advertise(interval_us, adv_data=adv_data, resp_data=resp_data, connectable=connectable)
 
     try:
         # Allow optional timeout for a central to connect to us (or just to stop advertising).
@@ -1,10 +1,8 @@
 # MicroPython aioble module
 # MIT license; Copyright (c) 2021 Jim Mussared
 
-from micropython import const, schedule
-import uasyncio as ayncio
-import binascii
-import json
+from micropython import const
+import uasyncio as asyncio
 
 from .core import log_info, log_warn, ble, register_irq_handler
 from .device import DeviceConnection
@@ -24,13 +22,56 @@ _PASSKEY_ACTION_INPUT = const(2)
 _PASSKEY_ACTION_DISP = const(3)
 _PASSKEY_ACTION_NUMCMP = const(4)
 
-_DEFAULT_PATH = "ble_secrets.json"
+_DEFAULT_PATH = "secrets.bin"
 
-_secrets = {}
-_modified = False
+_secrets = None
 _path = None
 
 
+class _MemoryStore:
+    # Default store, bonds are lost on reset. See set_store.
+    def __init__(self, path=None):
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, sec_type, key):
+        return self._entries.get((sec_type, key))
+
+    def get_index(self, sec_type, index):
+        for (t, _), value in self._entries.items():
+            if t == sec_type:
+                if index == 0:
+                    return value
+                index -= 1
+        return None
+
+    def set(self, sec_type, key, value):
+        self._entries[sec_type, key] = value
+
+    def delete(self, sec_type, key):
+        return self._entries.pop((sec_type, key), None) is not None
+
+    def clear(self):
+        self._entries = {}
+
+    def save(self):
+        return False
+
+
+_store_factory = _MemoryStore
+
+
+# Sets the callable that opens the secret store for a path, e.g. a class.
+# The store needs get(sec_type, key), get_index(sec_type, index),
+# set(sec_type, key, value), delete(sec_type, key), clear() and save().
+# Must call this before load_secrets.
+def set_store(factory):
+    global _store_factory
+    _store_factory = factory
+
+
 # Must call this before stack startup.
 def load_secrets(path=None):
     global _path, _secrets
@@ -38,43 +79,22 @@ def load_secrets(path=None):
     # Use path if specified, otherwise use previous path, otherwise use
     # default path.
     _path = path or _path or _DEFAULT_PATH
+    _secrets = _store_factory(_path)
 
-    # Reset old secrets.
-    _secrets = {}
-    try:
-        with open(_path, "r") as f:
-            entries = json.load(f)
-            for sec_type, key, value in entries:
-                # Decode bytes from hex.
-                _secrets[sec_type, binascii.a2b_base64(key)] = binascii.a2b_base64(value)
-    except:
-        log_warn("No secrets available")
-
-
-# Call this whenever the secrets dict changes.
-def _save_secrets(arg=None):
-    global _modified, _path
 
-    _path = _path or _DEFAULT_PATH
+def secrets():
+    if _secrets is None:
+        load_secrets()
+    return _secrets
 
-    if not _modified:
-        # Only save if the secrets changed.
-        return
 
-    with open(_path, "w") as f:
-        # Convert bytes to hex strings (otherwise JSON will treat them like
-        # strings).
-        json_secrets = [
-            (sec_type, binascii.b2a_base64(key), binascii.b2a_base64(value))
-            for (sec_type, key), value in _secrets.items()
-        ]
-        json.dump(json_secrets, f)
-        _modified = False
+# Writes the keys if they changed. Not called from the IRQ: pairing sets
+# several keys in a row, the application saves once (e.g. on disconnect).
+def save_secrets():
+    return _secrets is not None and _secrets.save()
 
 
 def _security_irq(event, data):
-    global _modified
-
     if event == _IRQ_ENCRYPTION_UPDATE:
         # Connection has updated (usually due to pairing).
         conn_handle, encrypted, authenticated, bonded, key_size = data
@@ -90,25 +110,16 @@ def _security_irq(event, data):
 
     elif event == _IRQ_SET_SECRET:
         sec_type, key, value = data
-        key = sec_type, bytes(key)
+        key = bytes(key)
         value = bytes(value) if value else None
 
-        log_info("set secret:", key, value)
+        log_info("set secret:", sec_type, key, value)
 
         if value is None:
             # Delete secret.
-            if key not in _secrets:
-                return False
-
-            del _secrets[key]
-        else:
-            # Save secret.
-            _secrets[key] = value
-
-        # Queue up a save (don't synchronously write to flash).
-        _modified = True
-        schedule(_save_secrets, None)
+            return secrets().delete(sec_type, key)
 
+        secrets().set(sec_type, key, value)
         return True
 
     elif event == _IRQ_GET_SECRET:
@@ -118,17 +129,10 @@ def _security_irq(event, data):
 
         if key is None:
             # Return the index'th secret of this type.
-            i = 0
-            for (t, _key), value in _secrets.items():
-                if t == sec_type:
-                    if i == index:
-                        return value
-                    i += 1
-            return None
+            return secrets().get_index(sec_type, index)
         else:
             # Return the secret for this key (or None).
-            key = sec_type, bytes(key)
-            return _secrets.get(key, None)
+            return secrets().get(sec_type, bytes(key))
 
     elif event == _IRQ_PASSKEY_ACTION:
         conn_handle, action, passkey = data
@@ -150,9 +154,8 @@ def _security_irq(event, data):
 
 
 def _security_shutdown():
-    global _secrets, _modified, _path
-    _secrets = {}
-    _modified = False
+    global _secrets, _path
+    _secrets = None
     _path = None
 
 
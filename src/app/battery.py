@@ -0,0 +1,195 @@
+"""MAX17048 fuel gauge reading, runtime estimate and sleep interval tuning, kept in RTC memory.
+
+With the gauge's ALRT pin wired to an RTC GPIO, the gauge wakes the node itself (ext0) when the
+state of charge moved by 1% or the cell voltage left the alert window. Wakes that are not
+battery alerts can then reuse the cached reading instead of polling the gauge.
+
+The discharge rate comes from SOC deltas across wakes: when the SOC dropped by at least 1% since
+the reference reading, the rate over that span is averaged into rate_x10000. Until there is such
+a span, the gauge's CRATE register is used. pick_sleep_ms stretches or shortens the sleep
+interval so the remaining charge lasts until the lifetime target.
+RTC memory region:
+    magic u16, version u8, flags u8, SOC u16 (1/256 %), cell voltage u16 (mV), time u32 (s),
+    reference SOC u16 (1/256 %), discharge rate u16 (0.001 %/h), reference time u32 (s),
+    lifetime target u32 (s), sleep interval u32 (ms)
+"""
+
+import struct
+import time
+from micropython import const
+from app import rtc_memory
+
+_MAGIC = const(0x4142)
+_VERSION = const(2)
+_FORMAT = "<HBBHHIHHIII"
+_FLAG_VALID = const(0x01)
+_FLAG_REFERENCE = const(0x02)
+_FLAG_RATE = const(0x04)  # rate_x10000 comes from SOC deltas
+_SOC_STEP = const(256)  # 1 %, the smallest SOC drop a rate is computed from
+_RATE_WEIGHT = const(4)  # moving average over about 4 spans
+
+
+class BatteryMonitor:
+    def __init__(self, gauge, mem=None):
+        """gauge - max1704x, or None when there is none
+        mem - writable buffer for the state, by default the RTC memory battery region"""
+        self.gauge = gauge
+        self.alert_pin = None
+        self._span_rate = None  # %/h over the span that ended with the last read
+        self._mem = rtc_memory.region(rtc_memory.BATTERY_OFFSET, rtc_memory.BATTERY_SIZE) if mem is None else mem
+        (
+            magic,
+            version,
+            self._flags,
+            self.soc_raw,
+            self.vcell_mv,
+            self.timestamp,
+            self._ref_soc,
+            self.rate_x1000,
+            self._ref_ts,
+            self.target_ts,
+            self.sleep_ms,
+        ) = struct.unpack_from(_FORMAT, self._mem, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._flags = self.soc_raw = self.vcell_mv = self.timestamp = 0
+            self._ref_soc = self.rate_x1000 = self._ref_ts = self.target_ts = self.sleep_ms = 0
+
+    def _store(self):
+        struct.pack_into(
+            _FORMAT,
+            self._mem,
+            0,
+            _MAGIC,
+            _VERSION,
+            self._flags,
+            self.soc_raw,
+            self.vcell_mv,
+            self.timestamp,
+            self._ref_soc,
+            self.rate_x1000,
+            self._ref_ts,
+            self.target_ts,
+            self.sleep_ms,
+        )
+
+    @property
+    def cached(self) -> bool:
+        return bool(self._flags & _FLAG_VALID)
+
+    def enable_alerts(self, pin_no: int, min_mv: int = 3400, max_mv: int = 4300):
+        """Makes the gauge assert ALRT on 1% SOC change and outside min_mv..max_mv, and wakes from deepsleep on it.
+        ALRT is open drain, active low; pin_no must be an RTC GPIO. Call on every boot.
+        The internal pull-up only stays on in deepsleep while the pad is held, so the pin is held from here on.
+        GPIO34..39 have no internal pulls, ALRT on one of them needs an external pull-up to 3V3."""
+        import esp32
+        from machine import Pin
+
+        # hold=False releases the hold of the last wake, a held pad cannot be reconfigured
+        self.alert_pin = Pin(pin_no, Pin.IN, Pin.PULL_UP, hold=False)
+        if self.gauge:
+            self.gauge.setSocChangeAlert(True)
+            self.gauge.setVoltageAlert(min_mv, max_mv)
+            if not self.alert_pin.value():
+                # still asserted from the alert that woke us, release it or it wakes us again at once
+                self.gauge.clearAlert()
+        # RTC GPIO hold latches the pull-up through deepsleep (gpio_deep_sleep_hold is for digital pads only)
+        self.alert_pin.init(hold=True)
+        esp32.wake_on_ext0(pin=self.alert_pin, level=esp32.WAKEUP_ALL_LOW)
+
+    def read(self, poll: bool = True, now: int = None) -> tuple:
+        """Returns (SOC %, cell voltage V), or (None, None) if nothing is known.
+        Without poll, the cached reading is returned when there is one, saving the I2C transaction.
+        now - time in s, time.time() by default"""
+        if (poll or not self.cached) and self.gauge:
+            self.vcell_mv, self.soc_raw = self.gauge.read_all_raw()
+            self.timestamp = time.time() if now is None else now
+            self._flags |= _FLAG_VALID
+            self._track()
+            self._store()
+        if not self.cached:
+            return None, None
+        return self.soc_raw / 256, self.vcell_mv / 1000
+
+    def _track(self):
+        """Folds the SOC drop since the reference reading into the discharge rate"""
+        soc, ts = self.soc_raw, self.timestamp
+        if not self._flags & _FLAG_REFERENCE or soc > self._ref_soc or ts < self._ref_ts:
+            # first reading, charging or clock reset: start a new span
+            self._ref_soc, self._ref_ts = soc, ts
+            self._flags |= _FLAG_REFERENCE
+            return
+        drop = self._ref_soc - soc
+        if drop < _SOC_STEP or ts == self._ref_ts:
+            return
+        # 1/256 % over seconds to 0.001 %/h
+        rate = min(drop * 1000 * 3600 // (256 * (ts - self._ref_ts)), 0xFFFF)
+        if self._flags & _FLAG_RATE:
+            self.rate_x1000 += (rate - self.rate_x1000) // _RATE_WEIGHT
+        else:
+            self.rate_x1000 = rate
+            self._flags |= _FLAG_RATE
+        self._span_rate = rate / 1000
+        self._ref_soc, self._ref_ts = soc, ts
+
+    def discharge_rate(self):
+        """Discharge rate in %/h from SOC history, else from CRATE, or None"""
+        if self._flags & _FLAG_RATE:
+            return self.rate_x1000 / 1000
+        if self.gauge:
+            try:
+                return max(-self.gauge.getCRate(), 0.0)
+            except OSError:
+                pass
+        return None
+
+    def remaining_hours(self):
+        """Estimated runtime left in hours, None when unknown or not discharging"""
+        rate = self.discharge_rate()
+        if not rate or not self.cached:
+            return None
+        return self.soc_raw / 256 / rate
+
+    def pick_sleep_ms(
+        self, sleep_ms: int, target_days: int, capacity_mah: int, sleep_ua: int, min_ms: int, max_ms: int, now=None
+    ) -> int:
+        """Returns the sleep interval that makes the remaining charge last target_days from the first call.
+        The measured rate is split into a sleep floor (sleep_ua on capacity_mah) and a part paid per wake,
+        which is scaled with the interval. The choice is kept for the next wakes in self.sleep_ms."""
+        now = time.time() if now is None else now
+        if not self.target_ts or now > self.target_ts + 366 * 86400:
+            # first call, or the clock was set
+            self.target_ts = now + target_days * 86400
+        rate, self._span_rate = self._span_rate, None
+        if self.sleep_ms:
+            sleep_ms = self.sleep_ms
+        elif rate is None:
+            rate = self.discharge_rate()  # first call, CRATE
+        if rate is not None and self.cached:
+            # the interval only changes at the end of a span, so every span is measured at one interval
+            floor = sleep_ua / (10 * capacity_mah)  # %/h
+            hours_left = max((self.target_ts - now) / 3600, 1)
+            allowed = self.soc_raw / 256 / hours_left
+            if allowed <= floor:
+                sleep_ms = max_ms
+            else:
+                # below floor / 16 the wake part is lost in the SOC resolution, assume that much
+                sleep_ms = int(sleep_ms * max(rate - floor, floor / 16) / (allowed - floor))
+            sleep_ms = min(max(sleep_ms, min_ms), max_ms)
+        self.sleep_ms = sleep_ms
+        self._store()
+        return sleep_ms
+
+    def summary(self, buf) -> bytes:
+        """Packs the estimate for BLE into buf (8 bytes): discharge rate u16 (0.001 %/h),
+        remaining runtime u16 (h, 0xFFFF unknown), sleep interval u32 (ms)"""
+        rate = self.discharge_rate()
+        hours = self.remaining_hours()
+        struct.pack_into(
+            "<HHI",
+            buf,
+            0,
+            0 if rate is None else min(int(rate * 1000), 0xFFFF),
+            0xFFFF if hours is None else min(int(hours), 0xFFFE),
+            self.sleep_ms,
+        )
+        return buf
@@ -0,0 +1,66 @@
+"""Connectionless beacon: the latest reading in the manufacturer data of a non-connectable advertisement.
+
+Collectors read it from a scan, without connecting, bonding or service discovery.
+Manufacturer specific data (AD type 0xFF), little endian:
+    company id  u16     BEACON_COMPANY_ID, 0xFFFF is reserved for tests
+    version     u8      BEACON_VERSION, bit 7 (BEACON_FLAG_MAC) set when a MAC follows
+    seq         u16     sequence number of the reading (app/rtc_ring.py), collectors drop repeats
+    temperature i16     centi-degrees Celsius, TEMP_UNKNOWN if not available
+    humidity    u16     centi-%RH, HUMIDITY_UNKNOWN if not available
+    distance    u16     millimetres
+    battery     u8      state of charge in %, BATTERY_UNKNOWN if not available
+    mac         4 bytes HMAC-SHA256 of everything above (company id included) with the shared key,
+                        truncated; only with a key. Covering seq makes a replayed packet stale.
+With a MAC the advertisement is 31 bytes including the name, the name is left out if it does not fit.
+"""
+
+import hashlib
+import struct
+from micropython import const
+from app.aioble.ble_advertising import advertising_payload
+
+BEACON_VERSION = const(1)
+BEACON_FLAG_MAC = const(0x80)
+_DATA_FORMAT = "<BHhHHB"
+_DATA_SIZE = const(10)
+_MAC_SIZE = const(4)
+_BLOCK_SIZE = const(64)  # SHA-256 block
+
+
+class Beacon:
+    def __init__(self, name=None, key: bytes = None, company_id: int = 0xFFFF):
+        """name - local name, sent when it fits, key - shared MAC key, None sends no MAC"""
+        self.name = name
+        self.company_id = company_id
+        self._data = bytearray(2 + _DATA_SIZE + (_MAC_SIZE if key else 0))
+        struct.pack_into("<H", self._data, 0, company_id)
+        self._ipad = self._opad = None
+        if key:
+            # HMAC (RFC 2104) on hashlib, there is no hmac module on MicroPython
+            if len(key) > _BLOCK_SIZE:
+                key = hashlib.sha256(key).digest()
+            key = bytes(key) + bytes(_BLOCK_SIZE - len(key))
+            self._ipad = bytes(b ^ 0x36 for b in key)
+            self._opad = bytes(b ^ 0x5C for b in key)
+
+    def mac(self, message) -> bytes:
+        """Truncated HMAC-SHA256 of message"""
+        inner = hashlib.sha256(self._ipad)
+        inner.update(message)
+        outer = hashlib.sha256(self._opad)
+        outer.update(inner.digest())
+        return outer.digest()[:_MAC_SIZE]
+
+    def payload(self, seq: int, temp_raw: int, humidity_raw: int, distance_mm: int, battery_raw: int) -> bytes:
+        """Advertising data for one reading in record units (see app/record.py raw_values)"""
+        data = self._data
+        version = BEACON_VERSION | (BEACON_FLAG_MAC if self._ipad else 0)
+        struct.pack_into(_DATA_FORMAT, data, 2, version, seq & 0xFFFF, temp_raw, humidity_raw, distance_mm, battery_raw)
+        if self._ipad:
+            end = 2 + _DATA_SIZE
+            data[end:] = self.mac(memoryview(data)[:end])
+        manufacturer = (self.company_id, bytes(memoryview(data)[2:]))
+        try:
+            return advertising_payload(name=self.name, manufacturer=manufacturer)
+        except ValueError:
+            return advertising_payload(manufacturer=manufacturer)
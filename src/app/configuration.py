@@ -1,6 +1,7 @@
 from micropython import const
 
 ENABLE_SLEEP = False  # Enable sleep mode
+FAST_BOOT = True  # Skip the start-up LED blinks and advertise as early as possible
 
 ADVERTIZING_LIMIT_MS = const(10_000)  # Advertising time in ms
 SLEEP_TIME_S = const(5)  # Sleep Time in seconds
@@ -10,3 +11,30 @@ INDICATE_TIMES = const(2)  # Number of times to indicate the sensor value per co
 DEVICE_NAME = const("NARMI000")  # Device name
 BTN_DOWN = const(34)  # Pin number for button down
 BTN_UP = const(35)  # Pin number for button up
+LEGACY_INDICATE = True  # Also indicate the per-field characteristics after each packed record, False saves airtime
+HISTORY_DIR = "history"  # Directory of the on-flash reading log
+HISTORY_SEGMENT_RECORDS = const(4096)  # Records per log segment file (11 bytes each)
+HISTORY_MAX_SEGMENTS = const(8)  # Log segments kept, the oldest one is deleted first
+HISTORY_FLUSH_EVERY = const(16)  # Readings appended to the history log between flushes, sleep always flushes
+HISTORY_PSM = const(0x0081)  # L2CAP PSM of the history download channel, 0 disables it
+HISTORY_L2CAP_MTU = const(512)  # Largest L2CAP SDU the history channel sends or accepts
+LINK_MTU = const(247)  # ATT MTU asked for after connect, a backlog indication carries (MTU - 3) // 19 records
+BEACON = False  # With ENABLE_SLEEP, broadcast the reading of every radio-less wake in a non-connectable advertisement
+BEACON_BURST_MS = const(100)  # Time the beacon advertises per wake
+BEACON_INTERVAL_US = const(20_000)  # Beacon advertising interval
+BEACON_KEY = None  # bytes shared with the collectors to authenticate the beacon with a 4 byte MAC, None sends none
+BEACON_COMPANY_ID = const(0xFFFF)  # Bluetooth SIG company id of the manufacturer data, 0xFFFF is for tests
+INDICATE_QUEUE_SIZE = const(8)  # Indications queued per connection before senders wait
+INDICATE_TIMEOUT_MS = const(1000)  # Time to wait for an indication confirmation
+INDICATE_RETRIES = const(2)  # Resends of an unconfirmed indication before it is dropped
+ADVERTISE_EVERY_N = const(1)  # With ENABLE_SLEEP, bring up BLE on every Nth timer wake only (1: every wake)
+WAKE_TEMP_DELTA = const(100)  # Temperature change (centi-degrees) that brings up BLE early, 0 disables
+WAKE_DISTANCE_DELTA = const(50)  # Distance change (mm) that brings up BLE early, 0 disables
+DISTANCE_PINGS = const(3)  # HCSR04 pings per reading (60 ms apart), the median of the valid echoes is used
+BATTERY_ALERT_PIN = None  # RTC GPIO on the MAX17048 ALRT pin (GPIO34-39 need an external pull-up), None polls
+BATTERY_ALERT_MIN_MV = const(3400)  # ALRT below this cell voltage (and on every 1% SOC change)
+BATTERY_ALERT_MAX_MV = const(4300)  # ALRT above this cell voltage
+BATTERY_CAPACITY_MAH = const(2000)  # Cell capacity, for the sleep current share of the discharge rate
+BATTERY_TARGET_DAYS = const(0)  # With ENABLE_SLEEP, tune the sleep interval to last this long, 0 keeps SLEEP_TIME_S
+BATTERY_MIN_SLEEP_MS = const(5000)  # Shortest sleep interval the tuning picks
+BATTERY_MAX_SLEEP_MS = const(3600000)  # Longest sleep interval the tuning picks
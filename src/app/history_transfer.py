@@ -0,0 +1,101 @@
+"""History download over an L2CAP connection-oriented channel.
+
+Indications carry one record per confirmation. For the stored history (app/tslog.py) the central
+opens a credit-based channel on a fixed PSM instead, and the records go out as fast as the peer
+hands out credits (aioble waits for _IRQ_L2CAP_SEND_READY when they run out).
+Protocol, little endian:
+    request, one SDU from the central: since u32, until u32 (s, both inclusive)
+    response: version u8, record size u8, reserved u16, record count u32,
+              then count records in the RECORD_FORMAT of app/tslog.py, oldest first
+The channel stays open for more requests until either side closes it. Records are read from flash
+into one reused buffer and sent as memoryview slices of it, a download allocates nothing per chunk.
+"""
+
+import struct
+import time
+import uasyncio as asyncio
+from micropython import const
+from app.aioble import DeviceDisconnectedError
+from app.aioble.l2cap import L2CAPDisconnectedError
+from app.tslog import RECORD_SIZE
+import app.trace as trace
+
+_VERSION = const(1)
+_REQUEST_FORMAT = "<II"
+_REQUEST_SIZE = const(8)
+_HEADER_FORMAT = "<BBHI"
+_HEADER_SIZE = const(8)
+
+
+class HistoryTransfer:
+    def __init__(self, log, psm: int, mtu: int = 512, chunk_records: int = None):
+        """log - TimeSeriesLog, psm - L2CAP PSM the central connects to, mtu - largest SDU
+        chunk_records - records per flash read, by default four SDUs worth"""
+        self.log = log
+        self.psm = psm
+        self.mtu = mtu
+        if chunk_records is None:
+            chunk_records = max(4 * mtu // RECORD_SIZE, 1)
+        self._buf = bytearray(chunk_records * RECORD_SIZE)
+        self._request = bytearray(_REQUEST_SIZE)
+        self._header = bytearray(_HEADER_SIZE)
+        self.idle = asyncio.Event()  # no download running
+        self.idle.set()
+        # last download
+        self.records = 0
+        self.elapsed_ms = 0
+
+    async def serve(self, connection):
+        """Accepts history channels from connection and answers their requests until it disconnects"""
+        try:
+            while True:
+                channel = await connection.l2cap_accept(self.psm, self.mtu)
+                print(f"History channel open, peer MTU {channel.peer_mtu}")
+                try:
+                    while True:
+                        n = await channel.recvinto(self._request)
+                        if n < _REQUEST_SIZE:
+                            print("History request too short:", n)
+                            continue
+                        await self._send(channel, *struct.unpack_from(_REQUEST_FORMAT, self._request, 0))
+                except L2CAPDisconnectedError:
+                    print("History channel closed")
+        except DeviceDisconnectedError:
+            pass
+        except (AttributeError, OSError) as e:
+            # firmware built without L2CAP channels
+            print("History channel not available:", e)
+
+    async def _send(self, channel, since: int, until: int):
+        self.idle.clear()
+        trace.begin(trace.HISTORY)
+        started = time.ticks_ms()
+        # the count is fixed here, readings appended during the download are not sent
+        total = remaining = self.log.count(since, until)
+        chunks = None
+        try:
+            struct.pack_into(_HEADER_FORMAT, self._header, 0, _VERSION, RECORD_SIZE, 0, total)
+            await channel.send(self._header)
+            mv = memoryview(self._buf)
+            chunks = self.log.read_chunks(self._buf, since, until)
+            for size in chunks:
+                size = min(size, remaining * RECORD_SIZE)
+                await channel.send(mv[:size])
+                remaining -= size // RECORD_SIZE
+                if not remaining:
+                    break
+            await channel.flush()
+        finally:
+            if chunks is not None:
+                chunks.close()
+            self.records = total - remaining
+            self.elapsed_ms = max(time.ticks_diff(time.ticks_ms(), started), 1)
+            trace.end(trace.HISTORY)
+            self.idle.set()
+        size = _HEADER_SIZE + self.records * RECORD_SIZE
+        rate = size * 60 // self.elapsed_ms  # bytes/ms is kB/s
+        print(f"History: {self.records} records, {size} bytes in {self.elapsed_ms} ms, {rate} kB/min")
+        if remaining:
+            # the oldest segment was dropped meanwhile, the central cannot tell where the stream ends
+            print(f"History: {remaining} records missing, closing the channel")
+            await channel.disconnect()
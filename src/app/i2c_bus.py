@@ -0,0 +1,297 @@
+"""Shared I2C bus: arbitration, retry with backoff, bus recovery and per-device quarantine.
+
+Drivers keep talking to the bus object (I2cBus.bus) or its adapter (I2cBus.adapter), but every
+transaction a task starts goes through I2cBus.call, which
+    - holds the bus lock for one attempt, so the SHT40 and MAX17048 never interleave
+    - retries an OSError after an awaited backoff (backoff_ms, doubled per attempt), so a flaky bus
+      does not block the event loop
+    - clocks a slave that holds SDA low out of its transfer and re-inits the bus
+    - counts errors per device; after max_failures failed calls in a row the device is skipped for
+      1, 2, 4, ... 64 sampling cycles, so a missing or broken sensor stops costing every wake
+open_bus picks the bus: the hardware I2C peripheral at the highest frequency of FREQS at which
+every device answers, SoftI2C only when the hardware bus sees none of them. A device that keeps
+failing at run time steps the bus down to the next frequency before it is quarantined.
+The quarantine state is kept in its own RTC memory region, so it survives deepsleep:
+    magic u16, version u8, reserved u8, then per device:
+    address u8, failed calls in a row u8, quarantine level u8, cycles left to skip u8
+"""
+
+import struct
+import time
+import uasyncio as asyncio
+from machine import Pin, I2C, SoftI2C
+from micropython import const
+from app import rtc_memory
+from app.sensor.sht40.bus_service import I2cAdapter
+import app.trace as trace
+
+_MAGIC = const(0x4249)
+_VERSION = const(1)
+_HEADER_FORMAT = "<HBB"
+_HEADER_SIZE = const(4)
+_ENTRY_FORMAT = "<BBBB"
+_ENTRY_SIZE = const(4)
+_MAX_DEVICES = const(3)  # (BUS_SIZE - header) / entry
+_MAX_LEVEL = const(6)  # longest quarantine is 2**6 cycles
+_ENODEV = const(19)
+FREQS = (400_000, 200_000, 100_000)  # tried in this order, the bus runs at the lowest one a device needs
+
+# device state
+_FAILS = const(0)
+_LEVEL = const(1)
+_SKIP = const(2)
+
+
+class I2cBus:
+    def __init__(
+        self,
+        bus,
+        scl: int,
+        sda: int,
+        freq: int,
+        retries: int = 2,
+        backoff_ms: int = 10,
+        max_failures: int = 3,
+        mem=None,
+        hw_id: int = None,
+        freqs: tuple = (),
+    ):
+        """bus - machine.I2C or machine.SoftI2C on pins scl and sda, running at freq
+        retries - attempts after the first one, backoff_ms - wait before the first retry
+        mem - writable buffer for the quarantine state, by default the RTC memory bus region
+        hw_id - id of the hardware I2C peripheral of bus, None for SoftI2C
+        freqs - frequencies below freq to step down to on errors"""
+        self.bus = bus
+        self.adapter = I2cAdapter(bus)
+        self.freq = freq
+        self.hw_id = hw_id
+        self._freqs = [f for f in freqs if f < freq]
+        self.present = ()  # devices found by open_bus
+        self._scl = scl
+        self._sda = sda
+        self._sda_pin = Pin(sda)  # reads the line level without changing the pin setup
+        self.retries = retries
+        self.backoff_ms = backoff_ms
+        self.max_failures = max_failures
+        self.lock = asyncio.Lock()
+        self.errors = {}  # address: OSErrors since boot
+        self.recoveries = 0
+        self._devices = {}  # address: bytearray of _FAILS, _LEVEL, _SKIP
+        self._mem = rtc_memory.region(rtc_memory.BUS_OFFSET, rtc_memory.BUS_SIZE) if mem is None else mem
+        magic, version, _ = struct.unpack_from(_HEADER_FORMAT, self._mem, 0)
+        if magic == _MAGIC and version == _VERSION:
+            for i in range(_MAX_DEVICES):
+                addr, fails, level, skip = struct.unpack_from(_ENTRY_FORMAT, self._mem, _HEADER_SIZE + i * _ENTRY_SIZE)
+                if addr:
+                    self._devices[addr] = bytearray((fails, level, skip))
+
+    def _store(self):
+        mem = self._mem
+        struct.pack_into(_HEADER_FORMAT, mem, 0, _MAGIC, _VERSION, 0)
+        offset = _HEADER_SIZE
+        for addr, dev in self._devices.items():
+            if offset >= _HEADER_SIZE + _MAX_DEVICES * _ENTRY_SIZE:
+                break
+            struct.pack_into(_ENTRY_FORMAT, mem, offset, addr, dev[_FAILS], dev[_LEVEL], dev[_SKIP])
+            offset += _ENTRY_SIZE
+        while offset < _HEADER_SIZE + _MAX_DEVICES * _ENTRY_SIZE:
+            struct.pack_into(_ENTRY_FORMAT, mem, offset, 0, 0, 0, 0)
+            offset += _ENTRY_SIZE
+
+    def _device(self, addr: int) -> bytearray:
+        dev = self._devices.get(addr)
+        if dev is None:
+            dev = self._devices[addr] = bytearray(3)
+        return dev
+
+    def available(self, addr: int) -> bool:
+        """False while the device is quarantined"""
+        dev = self._devices.get(addr)
+        return dev is None or not dev[_SKIP]
+
+    def new_cycle(self):
+        """Call once per sampling cycle, counts the quarantines down"""
+        changed = False
+        for dev in self._devices.values():
+            if dev[_SKIP]:
+                dev[_SKIP] -= 1
+                changed = True
+        if changed:
+            self._store()
+
+    def _error(self, addr: int):
+        self.errors[addr] = self.errors.get(addr, 0) + 1
+        trace.count(trace.C_I2C_ERROR)
+        if not self._sda_pin.value():
+            self.recover()
+
+    def _succeeded(self, addr: int):
+        dev = self._devices.get(addr)
+        if dev is not None and (dev[_FAILS] or dev[_LEVEL]):
+            dev[_FAILS] = dev[_LEVEL] = 0
+            self._store()
+
+    def _failed(self, addr: int):
+        dev = self._device(addr)
+        dev[_FAILS] += 1
+        # a device that answered the scan is failing on signal quality, a slower clock may do
+        if addr in self.present and self.step_down():
+            self._store()
+            return
+        if dev[_FAILS] >= self.max_failures:
+            dev[_SKIP] = 1 << dev[_LEVEL]
+            dev[_FAILS] = 0
+            if dev[_LEVEL] < _MAX_LEVEL:
+                dev[_LEVEL] += 1
+            print(f"I2C device 0x{addr:02x} skipped for {dev[_SKIP]} cycles")
+        self._store()
+
+    async def call(self, addr: int, func, *args):
+        """Runs func(*args), a transaction with the device at addr, and returns its result.
+        Raises the last OSError when every attempt failed, OSError(ENODEV) while the device is quarantined."""
+        if not self.available(addr):
+            raise OSError(_ENODEV)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # the lock is free while we wait, the other devices keep the bus
+                await asyncio.sleep_ms(self.backoff_ms << (attempt - 1))
+            async with self.lock:
+                try:
+                    result = func(*args)
+                except OSError as e:
+                    error = e
+                    self._error(addr)
+                    continue
+            self._succeeded(addr)
+            return result
+        self._failed(addr)
+        raise error
+
+    def run(self, addr: int, func, *args):
+        """call for synchronous code that runs while no task uses the bus (initialisation).
+        Retries at once, without the lock and without backoff."""
+        if not self.available(addr):
+            raise OSError(_ENODEV)
+        for attempt in range(self.retries + 1):
+            try:
+                result = func(*args)
+            except OSError as e:
+                self._error(addr)
+                if attempt < self.retries:
+                    continue
+                self._failed(addr)
+                raise e
+            self._succeeded(addr)
+            return result
+
+    def recover(self) -> bool:
+        """Clocks SCL until a slave holding SDA low releases it, sends a STOP and re-inits the bus.
+        Returns True if SDA is released."""
+        scl = Pin(self._scl, Pin.OPEN_DRAIN, Pin.PULL_UP, value=1)
+        sda = Pin(self._sda, Pin.OPEN_DRAIN, Pin.PULL_UP, value=1)
+        # a slave in the middle of a byte lets go after at most 9 clocks
+        for _ in range(9):
+            if sda.value():
+                break
+            scl.value(0)
+            time.sleep_us(5)
+            scl.value(1)
+            time.sleep_us(5)
+        # STOP: SDA rises while SCL is high
+        scl.value(0)
+        sda.value(0)
+        time.sleep_us(5)
+        scl.value(1)
+        time.sleep_us(5)
+        sda.value(1)
+        time.sleep_us(5)
+        released = bool(sda.value())
+        self._init_bus(self.freq)
+        self.recoveries += 1
+        trace.count(trace.C_I2C_RECOVER)
+        print("I2C bus recovered" if released else "I2C bus recovery failed, SDA still low")
+        return released
+
+    def _init_bus(self, freq: int):
+        if self.hw_id is None:
+            self.bus.init(scl=Pin(self._scl), sda=Pin(self._sda), freq=freq)
+        else:
+            # the ESP32 hardware I2C objects are singletons, this re-inits self.bus in place
+            I2C(self.hw_id, scl=Pin(self._scl), sda=Pin(self._sda), freq=freq)
+        self.freq = freq
+
+    def step_down(self) -> bool:
+        """Moves the bus to the next lower frequency. Returns False at the lowest one."""
+        if not self._freqs:
+            return False
+        self._init_bus(self._freqs.pop(0))
+        print(f"I2C bus stepped down to {self.freq // 1000} kHz")
+        return True
+
+    def config(self) -> str:
+        kind = "SoftI2C" if self.hw_id is None else f"I2C({self.hw_id})"
+        devices = ", ".join(f"0x{addr:02x}" for addr in self.present)
+        return f"{kind} scl={self._scl} sda={self._sda} {self.freq // 1000} kHz, devices: {devices or 'none'}"
+
+    def stats(self) -> str:
+        return f"errors: {self.errors}, recoveries: {self.recoveries}, quarantined: " + str(
+            [hex(addr) for addr, dev in self._devices.items() if dev[_SKIP]]
+        )
+
+
+def _negotiate(make, addresses, freqs):
+    """Scans the bus made by make(freq) at every frequency until all addresses answered.
+    Returns (bus set to the frequency, frequency, present addresses); bus is None when it could not be set up."""
+    found = {}  # address: highest frequency it answered at
+    bus = None
+    last = None
+    for freq in freqs:
+        try:
+            bus = make(freq)
+            last = freq
+            seen = bus.scan()
+        except (OSError, ValueError) as e:
+            print(f"I2C at {freq // 1000} kHz failed:", e)
+            continue
+        for addr in addresses:
+            if addr in seen and addr not in found:
+                found[addr] = freq
+        if len(found) == len(addresses):
+            break
+    if bus is None or not found:
+        return bus, last or freqs[-1], ()
+    freq = min(found.values())
+    if freq != last:
+        bus = make(freq)
+    return bus, freq, tuple(addr for addr in addresses if addr in found)
+
+
+def open_bus(scl: int, sda: int, addresses, freqs: tuple = FREQS, hw_id: int = 0, **kwargs) -> I2cBus:
+    """Returns an I2cBus on the hardware peripheral hw_id at the highest of freqs at which every device
+    in addresses answers, or on SoftI2C when the hardware bus finds fewer devices.
+    Devices that do not answer at any frequency are left out of self.present.
+    Returns None when neither bus could be constructed.
+    kwargs - passed on to I2cBus"""
+    def make_hw(f):
+        return I2C(hw_id, scl=Pin(scl), sda=Pin(sda), freq=f)
+
+    hw_bus, freq, present = _negotiate(make_hw, addresses, freqs)
+    if hw_bus is not None and len(present) == len(addresses):
+        bus = I2cBus(hw_bus, scl, sda, freq, hw_id=hw_id, freqs=freqs, **kwargs)
+    else:
+        soft_bus, soft_freq, soft_present = _negotiate(
+            lambda f: SoftI2C(scl=Pin(scl), sda=Pin(sda), freq=f), addresses, freqs
+        )
+        if hw_bus is None and soft_bus is None:
+            print("I2C bus not available")
+            return None
+        if hw_bus is None or len(soft_present) > len(present):
+            bus = I2cBus(soft_bus, scl, sda, soft_freq, freqs=freqs, **kwargs)
+            present = soft_present
+        else:
+            # the SoftI2C scan took the pins over, hand them back to the peripheral
+            bus = I2cBus(make_hw(freq), scl, sda, freq, hw_id=hw_id, freqs=freqs, **kwargs)
+    bus.present = present
+    print("I2C bus:", bus.config())
+    return bus
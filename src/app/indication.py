@@ -0,0 +1,157 @@
+"""Confirmation-driven GATT indication pipeline on aioble.
+
+Only one indication per connection can be in flight. Each connection gets a bounded queue and a
+task that sends the next indication with Characteristic.indicate as soon as the previous one is
+confirmed (aioble waits for _IRQ_GATTS_INDICATE_DONE), so throughput follows the connection
+interval instead of a fixed sleep.
+aioble allows one indication per characteristic at a time, so the connections take turns on a
+per-characteristic lock; waiting for another connection's indication does not spend a retry.
+Unconfirmed indications are retried after timeout_ms, on a failure status or a stack error, then dropped.
+"""
+
+import uasyncio as asyncio
+from app.aioble import GattError, DeviceDisconnectedError
+from app.primitives.queue import Queue, QueueFull
+import app.trace as trace
+
+_STATUS_TIMEOUT = -1
+
+
+class _Channel:
+    def __init__(self, maxsize):
+        self.queue = Queue(maxsize)
+        self.status = None
+        self.characteristic = None  # in flight
+        self.idle = asyncio.Event()  # queue empty and nothing in flight
+        self.idle.set()
+        self.task = None
+
+
+class IndicationQueue:
+    """Per-connection indication queues with backpressure"""
+
+    def __init__(self, maxsize=8, timeout_ms=1000, retries=2):
+        self._maxsize = maxsize
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self._channels = {}
+        self._locks = {}  # characteristic: Lock, held while its indication is in flight
+        # statistics
+        self.confirmed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def open(self, connection):
+        """Call with the DeviceConnection aioble.advertise returned"""
+        chan = _Channel(self._maxsize)
+        chan.task = asyncio.create_task(self._run(connection, chan))
+        self._channels[connection] = chan
+
+    def close(self, connection):
+        """Call once the connection is gone. Queued indications are discarded."""
+        chan = self._channels.pop(connection, None)
+        if chan:
+            chan.task.cancel()
+            self.dropped += chan.queue.qsize()
+            chan.idle.set()
+
+    async def put(self, connection, characteristic, data=None):
+        """Queue an indication, waiting while the connection's queue is full.
+        data - value to send, or None to send the current local value at send time."""
+        chan = self._channels.get(connection)
+        if chan is None:
+            return
+        chan.idle.clear()
+        await chan.queue.put((characteristic, data))
+
+    def put_nowait(self, connection, characteristic, data=None) -> bool:
+        """Queue an indication from synchronous code. Returns False if it was dropped (queue full)."""
+        chan = self._channels.get(connection)
+        if chan is None:
+            return False
+        try:
+            chan.queue.put_nowait((characteristic, data))
+        except QueueFull:
+            self.dropped += 1
+            return False
+        chan.idle.clear()
+        return True
+
+    def pending(self, connection) -> int:
+        """Number of queued or in-flight indications"""
+        chan = self._channels.get(connection)
+        if chan is None:
+            return 0
+        return chan.queue.qsize() + (chan.characteristic is not None)
+
+    async def wait_idle(self, connection=None):
+        """Wait until every queued indication (of one connection, or all of them) is confirmed or dropped"""
+        for conn in (connection,) if connection is not None else tuple(self._channels):
+            chan = self._channels.get(conn)
+            if chan:
+                await chan.idle.wait()
+
+    def _lock(self, characteristic):
+        lock = self._locks.get(characteristic)
+        if lock is None:
+            lock = self._locks[characteristic] = asyncio.Lock()
+        return lock
+
+    async def _send(self, connection, chan, characteristic, data) -> bool:
+        chan.status = None
+        backoff = False
+        async with self._lock(characteristic):
+            if not connection.is_connected():
+                raise DeviceDisconnectedError
+            trace.begin(trace.INDICATE)
+            try:
+                await characteristic.indicate(
+                    connection, characteristic.read() if data is None else data, self.timeout_ms
+                )
+            except GattError as e:
+                chan.status = e._status
+            except asyncio.TimeoutError:
+                chan.status = _STATUS_TIMEOUT
+            except ValueError:
+                # "Not connected"; "In progress" cannot happen while the lock is held
+                if not connection.is_connected():
+                    raise DeviceDisconnectedError
+                raise
+            except OSError as e:
+                if not connection.is_connected():
+                    raise DeviceDisconnectedError
+                # stack out of buffers
+                chan.status = e.errno
+                backoff = True
+            finally:
+                # failed attempts are spans too, the counters tell them apart
+                trace.end(trace.INDICATE)
+        if chan.status is None:
+            trace.count(trace.C_INDICATE_OK)
+            return True
+        trace.count(trace.C_INDICATE_FAIL)
+        if backoff:
+            await asyncio.sleep_ms(10)
+        return False
+
+    async def _run(self, connection, chan):
+        while True:
+            characteristic, data = await chan.queue.get()
+            chan.characteristic = characteristic
+            for attempt in range(self.retries + 1):
+                try:
+                    sent = await self._send(connection, chan, characteristic, data)
+                except DeviceDisconnectedError:
+                    # close() discards the rest
+                    return
+                if sent:
+                    self.confirmed += 1
+                    break
+                if attempt < self.retries:
+                    self.retried += 1
+            else:
+                self.dropped += 1
+                print(f"Indication dropped (handle: {connection._conn_handle}, status: {chan.status})")
+            chan.characteristic = None
+            if chan.queue.empty():
+                chan.idle.set()
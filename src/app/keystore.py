@@ -0,0 +1,139 @@
+"""Bond keys of the BLE stack (_IRQ_SET_SECRET / _IRQ_GET_SECRET) in a compact binary file.
+
+File layout (little endian):
+    header      magic u32, record count u16
+    records     sec_type u8, reserved u8, key length u16, value length u16, key, value
+Only the record header is fixed size. Key and value lengths are whatever the BLE stack hands to
+_IRQ_SET_SECRET and differ per sec_type and stack version, so records carry their lengths instead
+of being padded to a guessed maximum that a longer value would not fit.
+Keys are kept in a dict for O(1) lookup and in one list per sec_type for lookup by index.
+The file is only rewritten by save() when something changed, through a temp file and a rename,
+so a power loss leaves either the old or the new store.
+"""
+
+import os
+import struct
+from micropython import const
+
+_MAGIC = const(0x3153_4B4E)  # "NKS1"
+_HEADER_FORMAT = "<IH"
+_HEADER_SIZE = const(6)
+_RECORD_FORMAT = "<BBHH"
+_RECORD_SIZE = const(6)
+_LEGACY_FILE = "secrets.json"
+
+
+class KeyStore:
+    def __init__(self, path: str = "secrets.bin"):
+        self._path = path
+        self._entries = {}  # (sec_type, key): value
+        self._by_type = {}  # sec_type: [key, ...] in insertion order
+        self.dirty = False
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, sec_type: int, key: bytes):
+        return self._entries.get((sec_type, key))
+
+    def get_index(self, sec_type: int, index: int):
+        """Value of the index-th key of sec_type, or None"""
+        keys = self._by_type.get(sec_type)
+        if keys is None or index >= len(keys):
+            return None
+        return self._entries[sec_type, keys[index]]
+
+    def set(self, sec_type: int, key: bytes, value: bytes):
+        entry = sec_type, key
+        old = self._entries.get(entry)
+        if old == value:
+            return
+        if old is None:
+            self._by_type.setdefault(sec_type, []).append(key)
+        self._entries[entry] = value
+        self.dirty = True
+
+    def delete(self, sec_type: int, key: bytes) -> bool:
+        """Returns False if there was no such key"""
+        if self._entries.pop((sec_type, key), None) is None:
+            return False
+        self._by_type[sec_type].remove(key)
+        self.dirty = True
+        return True
+
+    def clear(self):
+        if self._entries:
+            self._entries = {}
+            self._by_type = {}
+            self.dirty = True
+
+    def items(self):
+        """Yields (sec_type, key, value)"""
+        for (sec_type, key), value in self._entries.items():
+            yield sec_type, key, value
+
+    def load(self):
+        self._entries = {}
+        self._by_type = {}
+        self.dirty = False
+        try:
+            with open(self._path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self._migrate()
+            return
+        if len(data) < _HEADER_SIZE:
+            print("Key store is empty or truncated")
+            return
+        magic, count = struct.unpack_from(_HEADER_FORMAT, data, 0)
+        if magic != _MAGIC:
+            print("Key store has an unknown format")
+            return
+        mv = memoryview(data)
+        offset = _HEADER_SIZE
+        for _ in range(count):
+            if offset + _RECORD_SIZE > len(data):
+                break
+            sec_type, _, key_len, value_len = struct.unpack_from(_RECORD_FORMAT, data, offset)
+            offset += _RECORD_SIZE
+            end = offset + key_len + value_len
+            if end > len(data):
+                break
+            self.set(sec_type, bytes(mv[offset : offset + key_len]), bytes(mv[offset + key_len : end]))
+            offset = end
+        self.dirty = False
+
+    def _migrate(self):
+        """Imports the keys of the old base64 JSON store once"""
+        try:
+            import json
+            import binascii
+
+            with open(_LEGACY_FILE, "r") as f:
+                entries = json.load(f)
+            for sec_type, key, value in entries:
+                self.set(sec_type, binascii.a2b_base64(key), binascii.a2b_base64(value))
+        except (OSError, ValueError):
+            return
+        print(f"Migrated {len(self)} bond keys from {_LEGACY_FILE}")
+        if self.save():
+            os.remove(_LEGACY_FILE)
+
+    def save(self) -> bool:
+        """Writes the store if it changed. Returns True if the file was written."""
+        if not self.dirty:
+            return False
+        tmp = self._path + ".tmp"
+        header = bytearray(_RECORD_SIZE)
+        with open(tmp, "wb") as f:
+            struct.pack_into(_HEADER_FORMAT, header, 0, _MAGIC, len(self._entries))
+            f.write(memoryview(header)[:_HEADER_SIZE])
+            for (sec_type, key), value in self._entries.items():
+                struct.pack_into(_RECORD_FORMAT, header, 0, sec_type, 0, len(key), len(value))
+                f.write(header)
+                f.write(key)
+                f.write(value)
+        os.rename(tmp, self._path)
+        self.dirty = False
+        return True
@@ -0,0 +1,99 @@
+"""Per-connection link setup and instrumentation.
+
+After connect, exchange_mtu asks for a larger ATT MTU, so a backlog indication can carry
+payload() // RECORD_SIZE records instead of one.
+MicroPython has no call for a peripheral to request connection parameters, the central alone
+picks the interval, peripheral latency and supervision timeout. The policy therefore records what
+the central applies (_IRQ_CONNECTION_UPDATE) in each phase of the connection:
+    SYNC - readings, backlog and history are being sent
+    IDLE - waiting for the next sampling round
+close() prints the time spent and the parameters seen per phase, to tune the central with.
+"""
+
+import time
+import uasyncio as asyncio
+from micropython import const
+import app.trace as trace
+
+SYNC = const(0)
+IDLE = const(1)
+PHASES = ("sync", "idle")
+_DEFAULT_MTU = const(23)
+_ATT_HEADER = const(3)  # opcode and handle in front of every indication
+
+
+class _Link:
+    def __init__(self):
+        self.phase = SYNC
+        self.since = time.ticks_ms()
+        self.phase_ms = [0, 0]
+        self.interval_us = 0  # 0 until the central reports one
+        self.latency = 0
+        self.timeout_ms = 0
+        self.phase_interval_us = [0, 0]  # last interval seen in each phase
+        self.updates = 0
+
+
+class LinkPolicy:
+    def __init__(self, mtu: int = 247, timeout_ms: int = 1000):
+        """mtu - ATT MTU asked for after connect, timeout_ms - time to wait for the exchange"""
+        self.mtu = mtu
+        self.timeout_ms = timeout_ms
+        self._links = {}  # conn_handle: _Link
+
+    def open(self, connection):
+        """Call once the central connected"""
+        self._links[connection._conn_handle] = _Link()
+
+    async def exchange_mtu(self, connection) -> int:
+        """Asks for self.mtu unless the central already exchanged one. Returns the ATT payload size."""
+        if not connection.mtu:
+            trace.begin(trace.MTU)
+            try:
+                await connection.exchange_mtu(self.mtu, self.timeout_ms)
+                trace.end(trace.MTU)
+            except (asyncio.TimeoutError, OSError, ValueError) as e:
+                print("MTU exchange failed:", e)
+        print(f"ATT MTU {connection.mtu or _DEFAULT_MTU}")
+        return self.payload(connection)
+
+    def payload(self, connection) -> int:
+        """Largest indication value on this connection"""
+        return (connection.mtu or _DEFAULT_MTU) - _ATT_HEADER
+
+    def phase(self, connection, phase: int):
+        """Switches the connection to SYNC or IDLE"""
+        link = self._links.get(connection._conn_handle)
+        if link and link.phase != phase:
+            self._account(link)
+            link.phase = phase
+            link.phase_interval_us[phase] = link.interval_us
+
+    def _account(self, link):
+        now = time.ticks_ms()
+        link.phase_ms[link.phase] += time.ticks_diff(now, link.since)
+        link.since = now
+
+    def update(self, conn_handle: int, interval: int, latency: int, supervision_timeout: int, status: int):
+        """Call on _IRQ_CONNECTION_UPDATE. interval in 1.25 ms units, supervision_timeout in 10 ms units."""
+        trace.count(trace.C_CONN_UPDATE)
+        link = self._links.get(conn_handle)
+        if link is None or status != 0:
+            return
+        link.interval_us = interval * 1250
+        link.latency = latency
+        link.timeout_ms = supervision_timeout * 10
+        link.phase_interval_us[link.phase] = link.interval_us
+        link.updates += 1
+
+    def close(self, conn_handle: int):
+        """Call after the disconnect with the handle the connection had. Prints the phase summary."""
+        link = self._links.pop(conn_handle, None)
+        if link is None:
+            return
+        self._account(link)
+        phases = ", ".join(
+            f"{name} {link.phase_ms[i]} ms @ {link.phase_interval_us[i] / 1000 or '?'} ms"
+            for i, name in enumerate(PHASES)
+        )
+        print(f"Link: {phases}, latency {link.latency}, timeout {link.timeout_ms} ms, {link.updates} updates")
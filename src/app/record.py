@@ -0,0 +1,85 @@
+"""Packed sensor record, sent as a single indication per sampling cycle.
+
+Layout (little endian, RECORD_SIZE bytes, fits the default 20 byte ATT payload):
+    version     u8      RECORD_VERSION
+    flags       u8      RECORD_FLAG_*
+    seq         u16     sequence number, wraps at 65536
+    timestamp   u32     device time in seconds (time.time())
+    temperature i16     centi-degrees Celsius, TEMP_UNKNOWN if not available
+    humidity    u16     centi-%RH, HUMIDITY_UNKNOWN if not available
+    distance    u16     millimetres
+    battery     u8      state of charge in %, BATTERY_UNKNOWN if not available
+    interval    u32     sampling interval in ms
+Backlog indications may carry several records back to back when the ATT MTU allows (see app/link.py).
+"""
+
+import struct
+from micropython import const
+
+RECORD_VERSION = const(1)
+RECORD_FORMAT = "<BBHIhHHBI"
+RECORD_SIZE = const(19)
+
+TEMP_UNKNOWN = const(0x7FFF)
+HUMIDITY_UNKNOWN = const(0xFFFF)
+BATTERY_UNKNOWN = const(0xFF)
+
+RECORD_FLAG_BACKLOG = const(0x01)  # reading taken while no central was connected
+
+
+def raw_values(temp, humidity, distance_cm, battery) -> tuple:
+    """Converts a reading to the integer units of the record: (centi-degrees, centi-%RH, mm, %).
+    temp, humidity and battery may be None when the sensor could not be read."""
+    return (
+        TEMP_UNKNOWN if temp is None else round(temp * 100),
+        HUMIDITY_UNKNOWN if humidity is None else round(humidity * 100),
+        round(distance_cm * 10) if distance_cm else 0,
+        BATTERY_UNKNOWN if battery is None else int(battery),
+    )
+
+
+def pack_record_raw(
+    buf, seq, timestamp, temp_raw, humidity_raw, distance_mm, battery_raw, interval_ms, flags=0, offset=0
+):
+    """Packs one reading given in record units (see raw_values) into buf at offset and returns buf"""
+    struct.pack_into(
+        RECORD_FORMAT,
+        buf,
+        offset,
+        RECORD_VERSION,
+        flags,
+        seq & 0xFFFF,
+        timestamp,
+        temp_raw,
+        humidity_raw,
+        distance_mm,
+        battery_raw,
+        interval_ms,
+    )
+    return buf
+
+
+def pack_record(buf, seq, timestamp, temp, humidity, distance_cm, battery, interval_ms, flags=0):
+    """Packs one reading into buf (bytearray of at least RECORD_SIZE bytes) and returns buf.
+    temp, humidity and battery may be None when the sensor could not be read."""
+    t, rh, dist, batt = raw_values(temp, humidity, distance_cm, battery)
+    return pack_record_raw(buf, seq, timestamp, t, rh, dist, batt, interval_ms, flags)
+
+
+def unpack_record(buf) -> tuple:
+    """Returns (version, flags, seq, timestamp, temp_c, humidity, distance_mm, battery, interval_ms).
+    Unknown values are returned as None."""
+    version, flags, seq, ts, t, rh, dist, batt, interval = struct.unpack_from(RECORD_FORMAT, buf, 0)
+    if version != RECORD_VERSION:
+        raise ValueError(f"Unsupported record version: {version}")
+    return (
+        version,
+        flags,
+        seq,
+        ts,
+        None if t == TEMP_UNKNOWN else t / 100,
+        None if rh == HUMIDITY_UNKNOWN else rh / 100,
+        dist,
+        None if batt == BATTERY_UNKNOWN else batt,
+        interval,
+    )
@@ -0,0 +1,49 @@
+"""RTC slow memory shared by everything that has to survive deepsleep.
+
+The ESP32 port exposes a single user blob through machine.RTC().memory(), so every user
+gets a fixed region of it. On ports without RTC memory (unix port, host tests) the blob
+only lives in RAM.
+"""
+
+from micropython import const
+
+try:
+    from machine import RTC
+except ImportError:
+    RTC = None
+
+RTC_MEMORY_SIZE = const(2048)  # MICROPY_HW_RTC_USER_MEM_MAX on ESP32
+
+# Regions: offset, size
+RING_OFFSET = const(0)
+RING_SIZE = const(1792)
+WAKE_OFFSET = const(1792)
+WAKE_SIZE = const(16)
+BATTERY_OFFSET = const(1808)
+BATTERY_SIZE = const(64)
+BUS_OFFSET = const(1872)
+BUS_SIZE = const(16)
+
+_mem = None
+
+
+def load() -> bytearray:
+    """Returns the whole RTC memory blob, read once per boot"""
+    global _mem
+    if _mem is None:
+        _mem = bytearray(RTC_MEMORY_SIZE)
+        if RTC is not None:
+            data = RTC().memory()
+            _mem[: len(data)] = data
+    return _mem
+
+
+def region(offset: int, size: int) -> memoryview:
+    """Returns a writable view of one region of the blob"""
+    return memoryview(load())[offset : offset + size]
+
+
+def commit():
+    """Writes the blob back to RTC memory. Call before deepsleep."""
+    if _mem is not None and RTC is not None:
+        RTC().memory(_mem)
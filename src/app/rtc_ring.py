@@ -0,0 +1,173 @@
+"""Ring buffer of readings kept in RTC slow memory across deepsleep.
+
+Readings use the integer units of app/record.py (timestamp s, centi-degrees, centi-%RH, mm, %).
+To fit the ~2 kB of RTC memory they are delta encoded:
+    header      HEADER_FORMAT, then the oldest and the newest reading as absolute values
+    slots       SLOT_SIZE bytes each, one per reading after the oldest one
+A delta slot holds the difference to the previous reading. When a difference does not fit,
+a key entry (KEY_MARKER plus the absolute reading) takes two slots instead.
+"""
+
+import struct
+from micropython import const
+from app import rtc_memory
+
+_MAGIC = const(0x4E52)
+_VERSION = const(1)
+HEADER_FORMAT = "<HBBHHHH"  # magic, version, reserved, count, tail slot, used slots, next seq
+ABS_FORMAT = "<IhHHB"  # timestamp, temperature, humidity, distance, battery
+_FIRST_OFFSET = const(12)
+_LAST_OFFSET = const(23)
+_SLOTS_OFFSET = const(34)
+DELTA_FORMAT = "<Bbbhb"  # dt, d_temperature, d_humidity, d_distance, d_battery
+SLOT_SIZE = const(6)
+KEY_MARKER = const(0xFF)
+
+
+def _fits_i8(value: int) -> bool:
+    return -128 <= value <= 127
+
+
+class RTCRingBuffer:
+    """Fixed-size FIFO of readings. When full, the oldest readings are dropped."""
+
+    def __init__(self, mem=None):
+        """mem - writable buffer to keep the ring in, by default the RTC memory ring region"""
+        self._mem = rtc_memory.region(rtc_memory.RING_OFFSET, rtc_memory.RING_SIZE) if mem is None else mem
+        self._slots = (len(self._mem) - _SLOTS_OFFSET) // SLOT_SIZE
+        self._tmp = bytearray(2 * SLOT_SIZE)  # entry being written
+        self._rd = bytearray(2 * SLOT_SIZE)  # entry being decoded
+        magic, version, _, self._count, self._tail, self._used, self._next_seq = struct.unpack_from(
+            HEADER_FORMAT, self._mem, 0
+        )
+        if magic != _MAGIC or version != _VERSION or self._tail >= self._slots or self._used > self._slots:
+            # cold boot or incompatible layout
+            self._count = self._tail = self._used = self._next_seq = 0
+            self._store_header()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def capacity_slots(self) -> int:
+        return self._slots
+
+    @property
+    def next_seq(self) -> int:
+        return self._next_seq
+
+    def take_seq(self) -> int:
+        """Returns the next sequence number and advances it. Used for readings sent directly."""
+        seq = self._next_seq
+        self._next_seq = (seq + 1) & 0xFFFF
+        self._store_header()
+        return seq
+
+    def _store_header(self):
+        struct.pack_into(
+            HEADER_FORMAT, self._mem, 0, _MAGIC, _VERSION, 0, self._count, self._tail, self._used, self._next_seq
+        )
+
+    def _read_slot(self, slot: int, dst: int):
+        start = _SLOTS_OFFSET + (slot % self._slots) * SLOT_SIZE
+        self._rd[dst : dst + SLOT_SIZE] = self._mem[start : start + SLOT_SIZE]
+
+    def _write_slot(self, slot: int, src: int):
+        start = _SLOTS_OFFSET + (slot % self._slots) * SLOT_SIZE
+        self._mem[start : start + SLOT_SIZE] = self._tmp[src : src + SLOT_SIZE]
+
+    def _read_entry(self, slot: int, prev: tuple) -> tuple:
+        """Decodes the entry at slot against the previous reading. Returns (reading, slots used)."""
+        self._read_slot(slot, 0)
+        rd = self._rd
+        if rd[0] == KEY_MARKER:
+            self._read_slot(slot + 1, SLOT_SIZE)
+            return struct.unpack_from(ABS_FORMAT, rd, 1), 2
+        dt, d_t, d_rh, d_dist, d_batt = struct.unpack_from(DELTA_FORMAT, rd, 0)
+        ts, t, rh, dist, batt = prev
+        return (ts + dt, t + d_t, rh + d_rh, dist + d_dist, batt + d_batt), 1
+
+    def append(self, timestamp: int, temp_raw: int, humidity_raw: int, distance_mm: int, battery_raw: int) -> int:
+        """Adds a reading, dropping the oldest ones if there is no room. Returns its sequence number."""
+        mem = self._mem
+        if self._count == 0:
+            struct.pack_into(
+                ABS_FORMAT, mem, _FIRST_OFFSET, timestamp, temp_raw, humidity_raw, distance_mm, battery_raw
+            )
+        else:
+            ts, t, rh, dist, batt = struct.unpack_from(ABS_FORMAT, mem, _LAST_OFFSET)
+            dt = timestamp - ts
+            d_t, d_rh, d_dist, d_batt = temp_raw - t, humidity_raw - rh, distance_mm - dist, battery_raw - batt
+            tmp = self._tmp
+            fits = _fits_i8(d_t) and _fits_i8(d_rh) and _fits_i8(d_batt) and -32768 <= d_dist <= 32767
+            if fits and 0 <= dt < KEY_MARKER:
+                need = 1
+                struct.pack_into(DELTA_FORMAT, tmp, 0, dt, d_t, d_rh, d_dist, d_batt)
+            else:
+                need = 2
+                tmp[0] = KEY_MARKER
+                struct.pack_into(ABS_FORMAT, tmp, 1, timestamp, temp_raw, humidity_raw, distance_mm, battery_raw)
+            while self._slots - self._used < need:
+                self._drop_oldest()
+            if self._count == 0:
+                # everything was dropped, the new reading becomes the oldest one
+                struct.pack_into(
+                    ABS_FORMAT, mem, _FIRST_OFFSET, timestamp, temp_raw, humidity_raw, distance_mm, battery_raw
+                )
+            else:
+                head = self._tail + self._used
+                for i in range(need):
+                    self._write_slot(head + i, i * SLOT_SIZE)
+                self._used += need
+        struct.pack_into(ABS_FORMAT, mem, _LAST_OFFSET, timestamp, temp_raw, humidity_raw, distance_mm, battery_raw)
+        self._count += 1
+        seq = self._next_seq
+        self._next_seq = (seq + 1) & 0xFFFF
+        self._store_header()
+        return seq
+
+    def peek(self) -> tuple:
+        """Returns the oldest reading as (seq, timestamp, temp_raw, humidity_raw, distance_mm, battery_raw)"""
+        if self._count == 0:
+            raise IndexError("ring buffer is empty")
+        return ((self._next_seq - self._count) & 0xFFFF,) + struct.unpack_from(ABS_FORMAT, self._mem, _FIRST_OFFSET)
+
+    def _drop_oldest(self):
+        self._count -= 1
+        if self._count == 0:
+            self._tail = self._used = 0
+            return
+        first = struct.unpack_from(ABS_FORMAT, self._mem, _FIRST_OFFSET)
+        second, n = self._read_entry(self._tail, first)
+        struct.pack_into(ABS_FORMAT, self._mem, _FIRST_OFFSET, *second)
+        self._tail = (self._tail + n) % self._slots
+        self._used -= n
+
+    def pop(self) -> tuple:
+        """Removes and returns the oldest reading, see peek"""
+        reading = self.peek()
+        self._drop_oldest()
+        self._store_header()
+        return reading
+
+    def clear(self):
+        self._count = self._tail = self._used = 0
+        self._store_header()
+
+    def __iter__(self):
+        """Yields every reading, oldest first, without removing them"""
+        if self._count == 0:
+            return
+        seq = (self._next_seq - self._count) & 0xFFFF
+        reading = struct.unpack_from(ABS_FORMAT, self._mem, _FIRST_OFFSET)
+        yield (seq,) + reading
+        slot = self._tail
+        for _ in range(self._count - 1):
+            reading, n = self._read_entry(slot, reading)
+            slot += n
+            seq = (seq + 1) & 0xFFFF
+            yield (seq,) + reading
+
+    def commit(self):
+        """Persists the ring (and the rest of RTC memory). Call before deepsleep."""
+        rtc_memory.commit()
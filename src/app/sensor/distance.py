@@ -1,5 +1,23 @@
 from machine import Pin, time_pulse_us
-from time import sleep_us, sleep_ms
+from time import sleep_us, sleep_ms, ticks_us, ticks_ms, ticks_diff
+from micropython import const
+from array import array
+import uasyncio as asyncio
+import app.trace as trace
+from app.sensor import sound_speed
+
+# HCSR04Async capture states
+_IDLE = const(0)
+_ARMED = const(1)  # trigger sent, waiting for the rising edge
+_HIGH = const(2)  # rising edge seen, waiting for the falling edge
+_DONE = const(3)
+_MIN_ECHO_US = const(100)  # shorter pulses are glitches (2 cm, the minimum range, is ~120 us)
+PING_CYCLE_MS = const(60)  # minimum trigger to trigger time, so a late echo is not taken for the next one
+
+# burst confidence
+CONFIDENCE_NONE = const(0)  # no valid echo
+CONFIDENCE_LOW = const(1)  # half of the pings or less were valid, or they spread too much
+CONFIDENCE_HIGH = const(2)
 
 
 class HCSR04:
@@ -8,7 +26,7 @@ class HCSR04:
         self.echo = Pin(echo_pin, Pin.IN)
         self.trigger.value(0)  # Initialize trigger pin to LOW
 
-    def measure_distance_cm(self):
+    def _trigger(self):
         # Trigger pulse
         self.trigger.value(0)
         sleep_us(5)
@@ -16,10 +34,9 @@ class HCSR04:
         sleep_us(10)
         self.trigger.value(0)
 
-        # Measure echo pulse duration
-        duration = time_pulse_us(self.echo, 1, 30000)  # 30ms timeout
-
-        # Return -1 if timeout occurs
+    @staticmethod
+    def _to_cm(duration):
+        # Return 0 if timeout occurs
         if duration < 0:
             return 0
 
@@ -27,9 +44,16 @@ class HCSR04:
         # Speed of sound is approximately 343m/s or 34300cm/s
         # Distance = (duration / 2) * speed of sound
         # Division by 2 because sound travels to object and back
-        distance = (duration * 34300) // 2000000
+        return (duration * 34300) // 2000000
 
-        return distance
+    def measure_distance_cm(self):
+        trace.begin(trace.HCSR04)
+        self._trigger()
+
+        # Measure echo pulse duration
+        duration = time_pulse_us(self.echo, 1, 30000)  # 30ms timeout
+        trace.end(trace.HCSR04)
+        return self._to_cm(duration)
 
     def continuous_measurement(self):
         while True:
@@ -38,7 +62,115 @@ class HCSR04:
             sleep_ms(500)  # 500ms interval
 
 
-# Usage example:
-if __name__ == "__main__":
-    sensor = HCSR04(trigger_pin=26, echo_pin=25)
-    sensor.continuous_measurement()
+class HCSR04Async(HCSR04):
+    """HCSR04 with the echo pulse timed by pin interrupts on both edges.
+    measure_distance_cm_async awaits the falling edge, so the event loop keeps running during the flight time."""
+
+    def __init__(self, trigger_pin=26, echo_pin=25, timeout_us=30000):
+        super().__init__(trigger_pin, echo_pin)
+        self.timeout_us = timeout_us
+        self._flag = asyncio.ThreadSafeFlag()
+        self._state = _IDLE
+        self._rise = 0
+        self._width = -1
+        self._edge_cb = self._edge  # bound once, a hard IRQ must not allocate
+        self._echoes = array("H", bytes(2 * 16))  # burst echo widths in us, sorted in place
+        self.confidence = CONFIDENCE_NONE  # of the last burst
+
+    def _edge(self, pin):
+        t = ticks_us()
+        state = self._state
+        if pin.value():
+            if state == _ARMED:
+                self._rise = t
+                self._state = _HIGH
+        elif state == _HIGH:
+            width = ticks_diff(t, self._rise)
+            if width < _MIN_ECHO_US:
+                # glitch, wait for the real echo
+                self._state = _ARMED
+                return
+            self._width = width
+            self._state = _DONE
+            self._flag.set()
+        # any other edge (before the trigger, after the echo) is ignored
+
+    async def measure_echo_us(self) -> int:
+        """Returns the echo pulse width in us, or -1 on timeout"""
+        trace.begin(trace.HCSR04)
+        self._width = -1
+        self._flag.clear()
+        self._state = _ARMED
+        self.echo.irq(handler=self._edge_cb, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+        self._trigger()
+        try:
+            await asyncio.wait_for_ms(self._flag.wait(), (self.timeout_us + 999) // 1000)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.echo.irq(handler=None)
+            self._state = _IDLE
+        trace.end(trace.HCSR04)
+        return self._width
+
+    async def measure_distance_cm_async(self):
+        """Same result as measure_distance_cm, 0 on timeout"""
+        return self._to_cm(await self.measure_echo_us())
+
+    async def burst_mm(
+        self,
+        pings: int = 5,
+        trimmed: bool = False,
+        spread_mm: int = 20,
+        temp_raw: int = sound_speed.DEFAULT_TEMP,
+        humidity_raw: int = 0,
+    ) -> int:
+        """Fires up to 16 pings PING_CYCLE_MS apart and returns the median (or, if trimmed, the mean of the middle
+        half) of the valid echoes in millimetres, 0 if none was valid. Timeouts are left out.
+        The speed of sound is compensated for temp_raw (centi-degrees) and humidity_raw (centi-%RH).
+        self.confidence is set to CONFIDENCE_LOW when half of the pings or less were valid or the middle half of
+        the echoes (all of them when fewer than 4 are valid) spreads over more than spread_mm."""
+        echo_us = await self.burst_echo_us(pings, trimmed, spread_mm)
+        return sound_speed.echo_to_mm(echo_us, temp_raw, humidity_raw)
+
+    async def burst_echo_us(self, pings: int = 5, trimmed: bool = False, spread_mm: int = 20) -> int:
+        """burst_mm before the conversion: the filtered echo width in us, 0 if none was valid.
+        For callers that only know the temperature after the burst."""
+        echoes = self._echoes
+        pings = min(pings, len(echoes))
+        n = 0
+        for i in range(pings):
+            started = ticks_ms()
+            width = await self.measure_echo_us()
+            if width >= 0:
+                # insertion sort, fixed point in us
+                j = n
+                while j > 0 and echoes[j - 1] > width:
+                    echoes[j] = echoes[j - 1]
+                    j -= 1
+                echoes[j] = width
+                n += 1
+            if i < pings - 1:
+                remaining = PING_CYCLE_MS - ticks_diff(ticks_ms(), started)
+                if remaining > 0:
+                    await asyncio.sleep_ms(remaining)
+        if n == 0:
+            self.confidence = CONFIDENCE_NONE
+            return 0
+        if trimmed and n >= 4:
+            q = n // 4
+            total = 0
+            for i in range(q, n - q):
+                total += echoes[i]
+            echo_us = total // (n - 2 * q)
+        elif n & 1:
+            echo_us = echoes[n // 2]
+        else:
+            echo_us = (echoes[n // 2 - 1] + echoes[n // 2]) // 2
+        if n >= 4:
+            spread = sound_speed.echo_to_mm(echoes[(3 * n) // 4] - echoes[n // 4])
+        else:
+            # too few echoes for quartiles (DISTANCE_PINGS = 3), the whole range has to agree
+            spread = sound_speed.echo_to_mm(echoes[n - 1] - echoes[0])
+        self.confidence = CONFIDENCE_LOW if 2 * n <= pings or spread > spread_mm else CONFIDENCE_HIGH
+        return echo_us
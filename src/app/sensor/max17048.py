@@ -19,8 +19,21 @@ class max1704x:
     REGISTER_MODE = const(0x06)
     REGISTER_VERSION = const(0x08)
     REGISTER_CONFIG = const(0x0C)
+    REGISTER_VALRT = const(0x14)  # MAX17048/9
+    REGISTER_CRATE = const(0x16)  # MAX17048/9
+    REGISTER_STATUS = const(0x1A)  # MAX17048/9
     REGISTER_COMMAND = const(0xFE)
 
+    CONFIG_ALSC = const(0x40)  # alert on 1% SOC change
+    CONFIG_ALRT = const(0x20)  # alert flag
+    STATUS_RI = const(0x01)  # reset indicator
+    STATUS_VH = const(0x02)  # voltage high
+    STATUS_VL = const(0x04)  # voltage low
+    STATUS_VR = const(0x08)  # voltage reset
+    STATUS_HD = const(0x10)  # SOC low (CONFIG.ATHD)
+    STATUS_SC = const(0x20)  # SOC changed by 1%
+    STATUS_ENVR = const(0x40)  # enable voltage reset alert, a setting, not an alert flag
+
     def __init__(self, i2c):
         """
         Initializes the I2C connection and checks for sensor presence.
@@ -28,6 +41,7 @@ class max1704x:
         try:
             self.i2c = i2c
             self.max1704xAddress = 0x36
+            self._buf4 = bytearray(4)  # VCELL and SOC, see read_all
 
             # Validate sensor presence and version
             if not self.sensor_exists():
@@ -81,7 +95,26 @@ class max1704x:
         Gets the remaining volts in the cell.
         """
         buf = self.__readRegister(REGISTER_VCELL)
-        return (buf[0] << 4 | buf[1] >> 4) / 1000.0
+        # 78.125 uV per LSB of the 16 bit register (MAX17048/9), the same as 1.25 mV per LSB of the
+        # 12 bit MAX17043 value in bits 15..4. The 12 bit value / 1000 read 1.25 times too low.
+        # Same scale as read_all_raw.
+        return ((buf[0] << 8) | buf[1]) / 12800.0
+
+    def read_all_raw(self):
+        """
+        Reads VCELL and SOC in one 4 byte transaction into a reused buffer.
+        Returns (millivolts, state of charge in 1/256 %).
+        """
+        buf = self._buf4
+        self.i2c.readfrom_mem_into(self.max1704xAddress, REGISTER_VCELL, buf)
+        return ((buf[0] << 8) | buf[1]) * 5 // 64, (buf[2] << 8) | buf[3]
+
+    def read_all(self):
+        """
+        Returns (state of charge in %, cell voltage in V) from one transaction.
+        """
+        mv, soc = self.read_all_raw()
+        return soc / 256, mv / 1000
 
     def getSoc(self):
         """
@@ -113,7 +146,8 @@ class max1704x:
         """
         Sets the alert level.
         """
-        self.threshold = 32 - threshold if threshold < 32 else 32
+        # ATHD is 5 bits: 32 - threshold, for 1..32 %
+        self.threshold = min(max(32 - threshold, 0), 31)
         buf = self.__readConfigRegister()
         buf[1] = (buf[1] & 0xE0) | self.threshold
         self.__writeConfigRegister(buf)
@@ -122,13 +156,50 @@ class max1704x:
         """
         Checks if the max17043 module is in alert.
         """
-        return (self.__readConfigRegister())[1] & 0x20
+        return (self.__readConfigRegister())[1] & CONFIG_ALRT
 
     def clearAlert(self):
         """
-        Clears the alert.
+        Clears the alert flags, which releases the ALRT pin. EnVR is kept.
+        """
+        buf = self.__readRegister(REGISTER_STATUS)
+        self.__writeRegister(REGISTER_STATUS, bytes((buf[0] & STATUS_ENVR, buf[1])))
+        buf = self.__readConfigRegister()
+        buf[1] &= ~CONFIG_ALRT & 0xFF
+        self.__writeConfigRegister(buf)
+
+    def getCRate(self):
+        """
+        Gets the approximate charge (positive) or discharge (negative) rate in %/hr, MAX17048/9 only.
         """
-        self.__readConfigRegister()
+        buf = self.__readRegister(REGISTER_CRATE)
+        raw = (buf[0] << 8) | buf[1]
+        if raw & 0x8000:
+            raw -= 0x10000
+        return raw * 0.208
+
+    def getStatus(self):
+        """
+        Gets the STATUS alert flags (STATUS_*), MAX17048/9 only.
+        """
+        return self.__readRegister(REGISTER_STATUS)[0]
+
+    def setVoltageAlert(self, min_mv=0, max_mv=5100):
+        """
+        Sets the cell voltage window outside which ALRT is asserted (20 mV steps), MAX17048/9 only.
+        """
+        self.__writeRegister(REGISTER_VALRT, bytes((min(min_mv // 20, 255), min(max_mv // 20, 255))))
+
+    def setSocChangeAlert(self, enable=True):
+        """
+        Asserts ALRT whenever the state of charge changes by 1%, MAX17048/9 only.
+        """
+        buf = self.__readConfigRegister()
+        if enable:
+            buf[1] |= CONFIG_ALSC
+        else:
+            buf[1] &= ~CONFIG_ALSC & 0xFF
+        self.__writeConfigRegister(buf)
 
     def quickStart(self):
         """
@@ -146,7 +217,7 @@ class max1704x:
         """
         Reads the configuration register, always returns a 2-byte bytearray.
         """
-        return self.__readRegister(REGISTER_CONFIG)
+        return bytearray(self.__readRegister(REGISTER_CONFIG))
 
     def __writeRegister(self, address, buf):
         """
@@ -186,6 +257,9 @@ if __name__ == "__main__":
     # Get the state of charge
     print("State of charge (%):", my_sensor.getSoc())
 
+    # Both in one transaction
+    print("SOC (%), VCell (V):", my_sensor.read_all())
+
     # Get the compensation value
     print("Compensation value:", my_sensor.getCompensateValue())
 
@@ -0,0 +1,169 @@
+"""Concurrent sampling of IBaseSensorEx drivers.
+
+SensorScheduler.sample starts every registered sensor, keeps their ready times (start time plus
+get_conversion_cycle_time, in us) on a min-heap and reads each one as soon as it is due, so a
+sampling cycle takes as long as the slowest conversion instead of the sum of all of them.
+A sensor with is_data_ready is polled from its ready time on until it reports ready or its
+timeout_ms ran out. Sensors with an I2C address start and read through the I2cBus
+(app/i2c_bus.py), quarantined ones are skipped.
+
+Adapters for the drivers that are not IBaseSensorEx themselves:
+    HCSR04Sensor - median echo of an HCSR04Async ping burst
+    GaugeSensor - MAX17048 reading through BatteryMonitor
+"""
+
+import heapq
+import time
+import uasyncio as asyncio
+from micropython import const
+from app.sensor.sht40.base_sensor import IBaseSensorEx
+from app.sensor.distance import PING_CYCLE_MS
+import app.trace as trace
+
+_POLL_MS = const(2)  # is_data_ready polling period
+
+
+class _Entry:
+    def __init__(self, sensor, addr, timeout_ms, start_args, read):
+        self.sensor = sensor
+        self.addr = addr
+        self.timeout_ms = timeout_ms
+        self.start_args = start_args
+        self.read = read or sensor.get_measurement_value
+        self.ready = getattr(sensor, "is_data_ready", None)
+
+
+class SensorScheduler:
+    def __init__(self, bus=None, timeout_ms: int = 100):
+        """bus - I2cBus for the sensors added with an address
+        timeout_ms - default time a sensor may take past its conversion time"""
+        self.bus = bus
+        self.timeout_ms = timeout_ms
+        self._entries = []
+        self.values = []  # of the last cycle, None for a failed or skipped sensor
+        self.latency_us = []  # of the last cycle, start of the cycle until the value was read
+
+    def add(self, sensor, addr: int = None, timeout_ms: int = None, start_args: tuple = (), read=None) -> int:
+        """Registers an IBaseSensorEx and returns its index in values and latency_us.
+        addr - I2C address, the start and the read then go through the bus
+        start_args - arguments of start_measurement
+        read - callable that replaces get_measurement_value, e.g. for a fixed-point read"""
+        self._entries.append(
+            _Entry(sensor, addr, self.timeout_ms if timeout_ms is None else timeout_ms, start_args, read)
+        )
+        self.values.append(None)
+        self.latency_us.append(0)
+        return len(self._entries) - 1
+
+    async def _run(self, entry, func, *args):
+        if entry.addr is None or self.bus is None:
+            return func(*args)
+        return await self.bus.call(entry.addr, func, *args)
+
+    async def sample(self) -> list:
+        """Samples every sensor once and returns self.values"""
+        values = self.values
+        latency = self.latency_us
+        heap = []
+        t0 = time.ticks_us()
+        for i, entry in enumerate(self._entries):
+            values[i] = None
+            latency[i] = 0
+            if entry.addr is not None and self.bus is not None and not self.bus.available(entry.addr):
+                continue
+            try:
+                await self._run(entry, entry.sensor.start_measurement, *entry.start_args)
+                due = time.ticks_diff(time.ticks_us(), t0) + entry.sensor.get_conversion_cycle_time()
+            except Exception as e:
+                print(f"Sensor {i} start error:", e)
+                trace.count(trace.C_SENSOR_ERROR)
+                continue
+            # (ready time, index, deadline), us since t0; the index breaks ties
+            heapq.heappush(heap, (due, i, due + entry.timeout_ms * 1000))
+        while heap:
+            due, i, deadline = heapq.heappop(heap)
+            entry = self._entries[i]
+            wait_us = due - time.ticks_diff(time.ticks_us(), t0)
+            if wait_us > 0:
+                await asyncio.sleep_ms((wait_us + 999) // 1000)
+            now = time.ticks_diff(time.ticks_us(), t0)
+            if entry.ready is not None and not entry.ready():
+                if now < deadline:
+                    heapq.heappush(heap, (now + _POLL_MS * 1000, i, deadline))
+                else:
+                    print(f"Sensor {i} timed out")
+                    trace.count(trace.C_SENSOR_ERROR)
+                continue
+            try:
+                values[i] = await self._run(entry, entry.read)
+            except Exception as e:
+                print(f"Sensor {i} read error:", e)
+                trace.count(trace.C_SENSOR_ERROR)
+            latency[i] = time.ticks_diff(time.ticks_us(), t0)
+        return values
+
+
+class HCSR04Sensor(IBaseSensorEx):
+    """IBaseSensorEx view of an HCSR04Async ping burst. The value is the filtered echo width in us,
+    0 if no ping was valid (see HCSR04Async.burst_echo_us and .confidence)."""
+
+    def __init__(self, sensor, pings: int = 5):
+        self.sensor = sensor
+        self.pings = pings
+        self.echo_us = 0
+        self._done = False
+        self._task = None
+
+    def get_conversion_cycle_time(self) -> int:
+        """Time of the ping burst in us, the last ping without its echo"""
+        return (self.pings - 1) * PING_CYCLE_MS * 1000
+
+    async def _burst(self):
+        self.echo_us = await self.sensor.burst_echo_us(self.pings)
+        self._done = True
+
+    def start_measurement(self):
+        if self._task is not None and not self._done:
+            self._task.cancel()
+        self._done = False
+        self._task = asyncio.create_task(self._burst())
+
+    def is_data_ready(self) -> bool:
+        return self._done
+
+    def get_measurement_value(self) -> int:
+        return self.echo_us
+
+    def is_single_shot_mode(self) -> bool:
+        return True
+
+    def is_continuously_mode(self) -> bool:
+        return False
+
+
+class GaugeSensor(IBaseSensorEx):
+    """IBaseSensorEx view of a BatteryMonitor. The gauge converts on its own, so the value,
+    (SOC %, cell voltage V), can be read at once."""
+
+    def __init__(self, monitor, poll=None):
+        """poll - callable returning the poll argument of BatteryMonitor.read, polls every time if None"""
+        self.monitor = monitor
+        self.poll = poll
+
+    def get_conversion_cycle_time(self) -> int:
+        return 0
+
+    def start_measurement(self):
+        pass
+
+    def get_measurement_value(self) -> tuple:
+        trace.begin(trace.MAX17048)
+        value = self.monitor.read(True if self.poll is None else self.poll())
+        trace.end(trace.MAX17048)
+        return value
+
+    def is_single_shot_mode(self) -> bool:
+        return False
+
+    def is_continuously_mode(self) -> bool:
+        return True
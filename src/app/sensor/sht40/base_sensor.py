@@ -53,6 +53,8 @@ class Device:
         # передавать первым битом старший или младший
         # для каждого устройства!
         self.msb_first = True
+        # ready format strings: byte order char -> {fmt_char: byte order char + fmt_char}
+        self._codecs = {"<": {}, ">": {}}
 
     def _get_byteorder_as_str(self) -> tuple:
         """Return byteorder as string"""
@@ -60,22 +62,38 @@ class Device:
             return "big", ">"
         return "little", "<"
 
+    def codec(self, fmt_char: str, redefine_byte_order: str = None) -> str:
+        """Returns the struct format string for fmt_char with the byte order prefix.
+        Built once per format and device, later calls only look it up."""
+        bo = ">" if self.big_byte_order else "<"
+        if redefine_byte_order is not None:
+            bo = redefine_byte_order[0]
+        codecs = self._codecs.get(bo)
+        if codecs is None:
+            codecs = self._codecs[bo] = {}
+        fmt = codecs.get(fmt_char)
+        if fmt is None:
+            if not fmt_char:
+                raise ValueError("Invalid fmt_char parameter!")
+            fmt = codecs[fmt_char] = bo + fmt_char
+        return fmt
+
     def pack(self, fmt_char: str, *values) -> bytes:
-        if not fmt_char:
-            raise ValueError("Invalid fmt_char parameter!")
-        bo = self._get_byteorder_as_str()[1]
-        return struct.pack(bo + fmt_char, values)
+        return struct.pack(self.codec(fmt_char), *values)
+
+    def pack_into(self, fmt_char: str, buf, offset: int, *values):
+        """Packs values into a preallocated buffer at offset"""
+        struct.pack_into(self.codec(fmt_char), buf, offset, *values)
 
     def unpack(self, fmt_char: str, source: bytes, redefine_byte_order: str = None) -> tuple:
         """распаковка массива, считанного из датчика.
         Если redefine_byte_order != None, то bo (смотри ниже) = redefine_byte_order
         fmt_char: c, b, B, h, H, i, I, l, L, q, Q. pls see: https://docs.python.org/3/library/struct.html"""
-        if not fmt_char:
-            raise ValueError("Invalid fmt_char parameter!")
-        bo = self._get_byteorder_as_str()[1]
-        if redefine_byte_order is not None:
-            bo = redefine_byte_order[0]
-        return struct.unpack(bo + fmt_char, source)
+        return struct.unpack(self.codec(fmt_char, redefine_byte_order), source)
+
+    def unpack_from(self, fmt_char: str, source, offset: int = 0, redefine_byte_order: str = None) -> tuple:
+        """Like unpack, but decodes from offset of a (preallocated) buffer without slicing it"""
+        return struct.unpack_from(self.codec(fmt_char, redefine_byte_order), source, offset)
 
     @micropython.native
     def is_big_byteorder(self) -> bool:
@@ -0,0 +1,31 @@
+"""Viper versions of crc_mod.crc8_31 and crc_mod.first_bad_word.
+Imported by crc_mod only where the viper emitter is available."""
+
+import micropython
+
+TABLE_31 = None  # set to crc_mod.TABLE_31 on import, so the two modules do not import each other
+
+
+@micropython.viper
+def crc8_31(buf, offset: int, length: int) -> int:
+    p = ptr8(buf)
+    table = ptr8(TABLE_31)
+    crc = 0xFF
+    i = offset
+    end = offset + length
+    while i < end:
+        crc = table[crc ^ p[i]]
+        i += 1
+    return crc
+
+
+@micropython.viper
+def first_bad_word(buf, offset: int, count: int) -> int:
+    p = ptr8(buf)
+    table = ptr8(TABLE_31)
+    i = offset
+    for w in range(count):
+        if table[table[0xFF ^ p[i]] ^ p[i + 1]] != p[i + 2]:
+            return w
+        i += 3
+    return -1
@@ -4,13 +4,14 @@ import time
 from machine import I2C, Pin
 from app.sensor.sht40 import bus_service
 from app.sensor.sht40.base_sensor import BaseSensorEx, IBaseSensorEx, check_value
-from app.sensor.sht40.crc_mod import crc8
+from app.sensor.sht40.crc_mod import crc8_31, first_bad_word
 from app.sensor.sht40.bus_service import I2cAdapter
+import app.trace as trace
 
 
 def _calc_crc(sequence) -> int:
     """Wrapper for short call."""
-    return crc8(sequence, polynomial=0x31, init_value=0xFF)
+    return crc8_31(sequence, 0, len(sequence))
 
 
 class SHT4xSensirion(BaseSensorEx, IBaseSensorEx):
@@ -34,6 +35,9 @@ class SHT4xSensirion(BaseSensorEx, IBaseSensorEx):
         #
         self._buf_1 = bytearray(1)
         self._buf_6 = bytearray(6)
+        # calibration of the fixed-point path, centi-degrees and centi-%RH
+        self._calib_t = 0
+        self._calib_rh = 0
 
     # @staticmethod
     # def get_answer_len(command_code: int) -> int:
@@ -65,10 +69,11 @@ class SHT4xSensirion(BaseSensorEx, IBaseSensorEx):
         self.read_to_buf(_buf)
         # response read
         if self._check_crc:
-            crc_from_buf = [_buf[i] for i in (2, 5)]  # list with CRC values
-            calculated_crc = [_calc_crc(_buf[rng.start : rng.stop]) for rng in (range(2), range(3, 5))]
-            if crc_from_buf != calculated_crc:
-                raise ValueError(f"Invalid CRC! Calculated: {calculated_crc}. From buffer: {crc_from_buf};")
+            bad = first_bad_word(_buf, 0, 2)
+            if bad >= 0:
+                offset = 3 * bad
+                calculated = crc8_31(_buf, offset, 2)
+                raise ValueError(f"Invalid CRC! Calculated: {calculated}. From buffer: {_buf[offset + 2]};")
         return _buf
 
     def get_id(self) -> tuple[int, int]:
@@ -77,7 +82,7 @@ class SHT4xSensirion(BaseSensorEx, IBaseSensorEx):
         # This 'wonder-sensor' cannot immediately return its programmed number! Need to call sleep_us!
         time.sleep_us(110)
         _buf = self._read_answer()
-        t = self.unpack("HBH", _buf)
+        t = self.unpack_from("HBH", _buf)
         # discard CRC
         return t[0], t[2]
 
@@ -126,6 +131,7 @@ class SHT4xSensirion(BaseSensorEx, IBaseSensorEx):
             _t = (0x15, 0x1E), (0x24, 0x2F), (0x32, 0x39)
             _cmd = _t[value][long_pulse]
 
+        trace.begin(trace.SHT40)
         self._send_command(_cmd)
         # get_conversion_cycle_time
         self._with_heater = with_heater
@@ -137,11 +143,32 @@ class SHT4xSensirion(BaseSensorEx, IBaseSensorEx):
         if SHT4xSensirion.cmd_get_id == _cmd:
             return
         _buf = self._read_answer()
-        _t = self.unpack("HBH", _buf)
+        trace.end(trace.SHT40)
+        _t = self.unpack_from("HBH", _buf)
         t = 175.0 * _t[0] / SHT4xSensirion.magic - 45.0
         rh = 125.0 * _t[2] / SHT4xSensirion.magic - 6.0
         return t, rh
 
+    def set_calibration_raw(self, temp_offset: int = 0, humidity_offset: int = 0):
+        """Sets the offsets added by get_measurement_raw, in centi-degrees and centi-%RH"""
+        self._calib_t = temp_offset
+        self._calib_rh = humidity_offset
+
+    def get_measurement_raw(self, out, offset: int = 0) -> bool:
+        """Fixed-point version of get_measurement_value. Writes the temperature in centi-degrees to out[offset]
+        and the relative humidity in centi-%RH (cropped to 0..10000) to out[offset + 1], calibration included.
+        out is a caller-provided buffer, e.g. array("h", (0, 0)). Integer arithmetic only, so nothing is
+        allocated unless the CRC check fails. Returns False if no measurement was started."""
+        if SHT4xSensirion.cmd_get_id == self._last_cmd_code:
+            return False
+        _buf = self._read_answer()
+        trace.end(trace.SHT40)
+        # T = -45 + 175 * St / 2^16, RH = -6 + 125 * Srh / 2^16
+        out[offset] = ((((_buf[0] << 8) | _buf[1]) * 4375) >> 14) - 4500 + self._calib_t
+        rh = ((((_buf[3] << 8) | _buf[4]) * 3125) >> 14) - 600 + self._calib_rh
+        out[offset + 1] = 0 if rh < 0 else 10000 if rh > 10000 else rh
+        return True
+
     def is_single_shot_mode(self) -> bool:
         return True
 
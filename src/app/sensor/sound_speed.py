@@ -0,0 +1,78 @@
+"""Speed of sound in air for the HCSR04 distance, from lookup tables instead of a sqrt per sample.
+
+Reference (reference_m_s):
+    c = 331.3 * sqrt(1 + T / 273.15) * (1 + 0.16 * h)
+    h = RH / 100 * p_sat(T) / 1013.25 hPa, the water vapour mole fraction, p_sat from the Magnus formula
+SPEED holds c in 0.01 m/s for dry air and HUMID the increase at 100 %RH, one entry per degree
+from TEMP_MIN to TEMP_MAX (the SHT40 range). Lookups interpolate linearly between degrees and take
+temperature and humidity in the centi units of app/record.py. test/sound_speed.py compares the
+tables with the formula.
+"""
+
+from micropython import const
+
+TEMP_MIN = const(-40)
+TEMP_MAX = const(85)
+DEFAULT_TEMP = const(2000)  # centi-degrees used when there is no temperature, 343.2 m/s
+
+# round(reference_m_s(t, 0) * 100) for t in TEMP_MIN..TEMP_MAX
+SPEED = (
+    30608, 30674, 30739, 30805, 30870, 30935, 31000, 31064, 31129, 31193, 31258, 31322,
+    31386, 31450, 31514, 31578, 31641, 31705, 31768, 31831, 31894, 31957, 32020, 32082,
+    32145, 32207, 32270, 32332, 32394, 32456, 32518, 32580, 32641, 32703, 32764, 32825,
+    32887, 32948, 33008, 33069, 33130, 33191, 33251, 33311, 33372, 33432, 33492, 33552,
+    33612, 33671, 33731, 33791, 33850, 33909, 33968, 34028, 34087, 34145, 34204, 34263,
+    34321, 34380, 34438, 34497, 34555, 34613, 34671, 34729, 34787, 34844, 34902, 34959,
+    35017, 35074, 35131, 35189, 35246, 35303, 35359, 35416, 35473, 35530, 35586, 35642,
+    35699, 35755, 35811, 35867, 35923, 35979, 36035, 36091, 36146, 36202, 36257, 36313,
+    36368, 36423, 36478, 36533, 36588, 36643, 36698, 36753, 36807, 36862, 36916, 36971,
+    37025, 37079, 37133, 37187, 37241, 37295, 37349, 37403, 37456, 37510, 37564, 37617,
+    37670, 37724, 37777, 37830, 37883, 37936,
+)
+
+# round((reference_m_s(t, 100) - reference_m_s(t, 0)) * 100) for t in TEMP_MIN..TEMP_MAX
+HUMID = (
+    1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 3,
+    3, 3, 4, 4, 4, 5, 5, 6, 6, 7, 7, 8,
+    9, 10, 11, 11, 12, 14, 15, 16, 17, 19, 20, 22,
+    24, 25, 27, 30, 32, 34, 37, 40, 43, 46, 49, 53,
+    57, 61, 65, 70, 75, 80, 86, 92, 98, 104, 111, 119,
+    127, 135, 144, 153, 163, 173, 184, 196, 208, 220, 234, 248,
+    263, 279, 295, 312, 331, 350, 370, 391, 413, 436, 461, 486,
+    513, 541, 570, 601, 633, 667, 702, 739, 777, 817, 859, 903,
+    948, 996, 1046, 1097, 1151, 1208, 1266, 1327, 1391, 1457, 1526, 1598,
+    1672, 1750, 1830, 1914, 2001, 2091, 2185, 2282, 2383, 2488, 2597, 2710,
+    2826, 2948, 3073, 3203, 3338, 3478,
+)
+
+
+def speed_x100(temp_raw: int = DEFAULT_TEMP, humidity_raw: int = 0) -> int:
+    """Speed of sound in 0.01 m/s. temp_raw in centi-degrees, humidity_raw in centi-%RH (0: dry air)"""
+    t = temp_raw - TEMP_MIN * 100
+    if t < 0:
+        t = 0
+    elif t > (TEMP_MAX - TEMP_MIN) * 100:
+        t = (TEMP_MAX - TEMP_MIN) * 100
+    i, frac = divmod(t, 100)
+    c = SPEED[i]
+    h = HUMID[i]
+    if frac:
+        c += (SPEED[i + 1] - c) * frac // 100
+        h += (HUMID[i + 1] - h) * frac // 100
+    if humidity_raw > 0:
+        c += h * humidity_raw // 10000
+    return c
+
+
+def echo_to_mm(echo_us: int, temp_raw: int = DEFAULT_TEMP, humidity_raw: int = 0) -> int:
+    """Distance in millimetres for an echo pulse of echo_us (there and back), rounded"""
+    return (echo_us * speed_x100(temp_raw, humidity_raw) + 100_000) // 200_000
+
+
+def reference_m_s(temp_c: float, rh: float = 0.0) -> float:
+    """The formula the tables are built from"""
+    import math
+
+    c = 331.3 * math.sqrt(1 + temp_c / 273.15)
+    p_sat = 6.1078 * 10 ** (7.5 * temp_c / (temp_c + 237.3))
+    return c * (1 + 0.16 * rh / 100 * p_sat / 1013.25)
@@ -7,24 +7,29 @@ if "calibration.py" not in os.listdir():
         f.write("CALIB_TEMP = 0.0\n")
         f.write("CALIB_HUMIDITY = 0.0\n")
 import esp32
-from machine import Pin, time_pulse_us, lightsleep, freq, SoftI2C, deepsleep
+from machine import Pin, time_pulse_us, lightsleep, freq, deepsleep
 import uasyncio as asyncio
 from micropython import const
 import bluetooth
-import random
 import struct
 import time
-import json
 import gc
 import sys
-import binascii
+from array import array
+from app import aioble
+from app.aioble import security
 from app.aioble.ble_advertising import advertising_payload
-from app.sensor.distance import HCSR04
-from app.driver.iqsbuttons import IQSButtons
+from app.keystore import KeyStore
+from app.sensor.distance import HCSR04Async, CONFIDENCE_HIGH
+from app.sensor.sound_speed import echo_to_mm
 import app.common as common
-from app.sensor.sht40.sht4xmod import SHT4xSensirion
-from app.sensor.sht40.bus_service import I2cAdapter
-from app.sensor.max17048 import max1704x
+import app.trace as trace
+from app.record import RECORD_SIZE, RECORD_FLAG_BACKLOG, pack_record_raw, raw_values
+from app.rtc_ring import RTCRingBuffer
+from app.indication import IndicationQueue
+from app.link import LinkPolicy, SYNC, IDLE
+from app.battery import BatteryMonitor
+from app.wake_policy import WAKE_TIMER, SLEEP_UA
 from calibration import CALIB_TEMP, CALIB_HUMIDITY
 from app.configuration import *
 
@@ -34,14 +39,9 @@ btn2 = Pin(35, Pin.IN, Pin.PULL_DOWN)
 esp32.wake_on_ext1(pins=(btn1, btn2), level=esp32.WAKEUP_ANY_HIGH)
 
 
-_IRQ_CENTRAL_CONNECT = const(1)
-_IRQ_CENTRAL_DISCONNECT = const(2)
-_IRQ_GATTS_WRITE = const(3)  # Add this line
-_IRQ_GATTS_INDICATE_DONE = const(20)
+_IRQ_CONNECTION_UPDATE = const(27)
 _IRQ_ENCRYPTION_UPDATE = const(28)
 _IRQ_PASSKEY_ACTION = const(31)
-_IRQ_GET_SECRET = const(29)
-_IRQ_SET_SECRET = const(30)
 _FLAG_READ = const(0x0002)
 _FLAG_NOTIFY = const(0x0010)
 _FLAG_INDICATE = const(0x0020)
@@ -79,6 +79,24 @@ _CALIB_CHAR = (
     _CALIB_CHAR_UUID,
     _FLAG_READ | _FLAG_WRITE | _FLAG_READ_ENCRYPTED,
 )
+# Packed sensor record, see app/record.py
+_RECORD_CHAR_UUID = bluetooth.UUID("4E41524D-4930-3030-0000-000000000001")
+_RECORD_CHAR = (
+    _RECORD_CHAR_UUID,
+    _FLAG_READ | _FLAG_NOTIFY | _FLAG_INDICATE | _FLAG_READ_ENCRYPTED,
+)
+# Wake-cycle trace summary, see app/trace.py
+_TRACE_CHAR_UUID = bluetooth.UUID("4E41524D-4930-3030-0000-000000000002")
+_TRACE_CHAR = (
+    _TRACE_CHAR_UUID,
+    _FLAG_READ | _FLAG_READ_ENCRYPTED,
+)
+# Battery runtime estimate, see app/battery.py
+_BATT_EST_CHAR_UUID = bluetooth.UUID("4E41524D-4930-3030-0000-000000000003")
+_BATT_EST_CHAR = (
+    _BATT_EST_CHAR_UUID,
+    _FLAG_READ | _FLAG_READ_ENCRYPTED,
+)
 # org.bluetooth.service.battery_service
 _BATT_SVC_UUID = bluetooth.UUID(0x180F)
 # org.bluetooth.characteristic.battery_level
@@ -101,6 +119,8 @@ _ENV_SENSE_SERVICE = (
         _INTERVAL_CHAR,
         _HUMIDITY_CHAR,
         _CALIB_CHAR,  # Add calibration characteristic
+        _RECORD_CHAR,
+        _TRACE_CHAR,
     ),
 )
 _SERVICES = (
@@ -110,11 +130,13 @@ _SERVICES = (
         (
             _BATT_CHAR,
             _BATT_VOLT_CHAR,
+            _BATT_EST_CHAR,
         ),
     ),
 )
 # org.bluetooth.characteristic.gap.appearance.xml
 _ADV_APPEARANCE_GENERIC_THERMOMETER = const(768)
+_ADV_INTERVAL_US = const(200_000)
 _IO_CAPABILITY_DISPLAY_ONLY = const(0)
 _IO_CAPABILITY_DISPLAY_YESNO = const(1)
 _IO_CAPABILITY_KEYBOARD_ONLY = const(2)
@@ -128,58 +150,144 @@ _ADDR_MODE = 0x00
 # 0x01 - RANDOM - Use a generated static address.
 # 0x02 - RPA - Use resolvable private addresses.
 # 0x03 - NRPA - Use non-resolvable private addresses.
+# I2C addresses
+_SHT40_ADDR = const(0x44)
+_MAX17048_ADDR = const(0x36)
 
 freq(240_000_000)
 gc.collect()
 gc.enable()
 
 
-def i2c_retry(retries=3, delay_ms=100):
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(retries):
-                try:
-                    return func(*args, **kwargs)
-                except OSError as e:
-                    last_exception = e
-                    print(f"I2C operation failed, attempt {attempt + 1}/{retries}")
-                    time.sleep_ms(delay_ms)
-            print(f"I2C operation failed after {retries} attempts")
-            return None
-
-        return wrapper
-
-    return decorator
+def _register_services(services):
+    """Registers services, laid out like a gatts_register_services tuple, as aioble objects.
+    Returns the aioble.Service objects in the same order."""
+    registered = []
+    for uuid, characteristics in services:
+        service = aioble.Service(uuid)
+        for char_uuid, flags in characteristics:
+            characteristic = aioble.Characteristic(
+                service,
+                char_uuid,
+                read=bool(flags & _FLAG_READ),
+                write=bool(flags & _FLAG_WRITE),
+                notify=bool(flags & _FLAG_NOTIFY),
+                indicate=bool(flags & _FLAG_INDICATE),
+            )
+            # aioble has no arguments for the encryption flags
+            characteristic.flags = flags
+        registered.append(service)
+    aioble.register_services(*registered)
+    return registered
 
 
 class BLENarmi:
-    def __init__(self, ble, name=DEVICE_NAME):
+    def __init__(self, ble, name=DEVICE_NAME, policy=None, radio=True):
+        """policy - WakePolicy of this wake, or None
+        radio - bring up BLE now. Without it, start() samples and either starts the radio (the policy
+        asks for a sync) or goes back to deepsleep."""
         self._ble = ble
         self.loop = asyncio.get_event_loop()
         # self.btns = IQSButtons(self.btn_cb, 35, 34, loop=self.loop)
         self._name = name
         self.t = 25
+        self.policy = policy
+        self.radio = False
+        self.distance = HCSR04Async()
+        self.SLEEP_FOR_MS = SLEEP_TIME_S * 1000
+        self.USER_INTERACTED = 0
+        self.ADVERTIZING_TIME_MS = 0
+        self.boot_to_advertise_ms = None  # ticks_ms since reset at the first advertisement
+        self.led = Pin(7, Pin.OUT, value=0)
+        self.indicate_loop = None  # task serving the current connection
+        self.sample_latency_us = [0, 0, 0, 0]  # SHT40, HCSR04, MAX17048, whole sampling stage
+        self.sht_raw = array("h", (0, 0))  # last SHT40 reading, centi-degrees and centi-%RH
+        self._record_buf = bytearray(RECORD_SIZE)
+        self._batt_est_buf = bytearray(8)
+        self.backlog = RTCRingBuffer()  # readings no central collected, kept across deepsleep
+        self._connections = set()
+        self._beacon = None
+        if BEACON:
+            from app.beacon import Beacon
+
+            self._beacon = Beacon(self._name, BEACON_KEY, BEACON_COMPANY_ID)
+        if radio:
+            self.start_radio()
+        # Sensors and the history log are not needed for the first advertisement
+        self._init_sensors()
+        self._init_scheduler()
+        if ENABLE_SLEEP and BATTERY_TARGET_DAYS and self.battery.sleep_ms:
+            # interval tuned for the lifetime target on an earlier wake
+            self.SLEEP_FOR_MS = self.battery.sleep_ms
+        self.history = None
+        self._history_pending = 0  # readings appended since the last flush
+        try:
+            from app.tslog import TimeSeriesLog
+
+            self.history = TimeSeriesLog(HISTORY_DIR, HISTORY_SEGMENT_RECORDS, HISTORY_MAX_SEGMENTS)
+        except OSError as e:
+            print("History log init failed:", e)
+        self.transfer = None  # history download over L2CAP
+        if self.history and HISTORY_PSM:
+            from app.history_transfer import HistoryTransfer
+
+            self.transfer = HistoryTransfer(self.history, HISTORY_PSM, HISTORY_L2CAP_MTU)
+
+    def start_radio(self):
+        """Activate BLE, register the services, start advertising and the tasks that serve centrals"""
+        trace.begin(trace.BLE_INIT)
         self._load_secrets()
-        self._ble.irq(self._irq)
+        # aioble owns ble.irq, this handler only sees what its modules leave unanswered
+        aioble.core.register_irq_handler(self._irq, None)
         self._ble.config(bond=True)
         self._ble.config(le_secure=True)
         self._ble.config(mitm=True)
         self._ble.config(io=_IO_CAPABILITY_NO_INPUT_OUTPUT)
         self._ble.active(True)
         self._ble.config(addr_mode=_ADDR_MODE)
-        self.distance = HCSR04()
-        self.SLEEP_FOR_MS = SLEEP_TIME_S * 1000
-        self.USER_INTERACTED = 0
-        self.ADVERTIZING_TIME_MS = 0
-        self.led = Pin(7, Pin.OUT, value=0)
-        self.indicate_loop = None
+        # also the MTU offered when the central starts the exchange
+        self._ble.config(mtu=LINK_MTU)
+
+        env_sense, battery = _register_services(_SERVICES)
+        (
+            self._temp_char,
+            self._distance_char,
+            self._interval_char,
+            self._humidity_char,
+            self._calib_char,
+            self._record_char,
+            self._trace_char,
+        ) = env_sense.characteristics
+        self._batt_level_char, self._batt_volt_char, self._batt_est_char = battery.characteristics
+
+        self._payload = advertising_payload(
+            name=self._name, services=[_ENV_SENSE_UUID], appearance=_ADV_APPEARANCE_GENERIC_THERMOMETER
+        )
+        self._indications = IndicationQueue(INDICATE_QUEUE_SIZE, INDICATE_TIMEOUT_MS, INDICATE_RETRIES)
+        self.link = LinkPolicy(LINK_MTU)
+        self.radio = True
+        self.set_interval(self.SLEEP_FOR_MS)
+        print("BLE Device initialized and ready to advertise")
+        trace.end(trace.BLE_INIT)
+        # the first advertisement goes out now, the tasks take over once the event loop runs
+        self._advertise()
+        asyncio.create_task(self._serve())
+        asyncio.create_task(self._receive_calibration())
 
+    def _init_sensors(self):
         # Initialize SHT40 sensor
-        self.i2c = SoftI2C(scl=Pin(22), sda=Pin(21), freq=100000)
+        from app.i2c_bus import open_bus
+        from app.sensor.sht40.sht4xmod import SHT4xSensirion
+        from app.sensor.max17048 import max1704x
+
+        # hardware I2C at the fastest clock both devices take, SoftI2C only if the peripheral fails
+        self.bus = open_bus(22, 21, (_SHT40_ADDR, _MAX17048_ADDR))
+        self.i2c = self.bus.bus if self.bus else None
         try:
-            adaptor = I2cAdapter(self.i2c)
-            self.sht = SHT4xSensirion(adaptor, address=0x44, check_crc=True)
+            if self.bus is None:
+                raise OSError("no I2C bus")
+            self.sht = SHT4xSensirion(self.bus.adapter, address=_SHT40_ADDR, check_crc=True)
+            self.sht.set_calibration_raw(int(CALIB_TEMP * 100), int(CALIB_HUMIDITY * 100))
             self.sht_available = True
         except Exception as e:
             print("SHT40 sensor init failed:", e)
@@ -187,9 +295,13 @@ class BLENarmi:
             self.sht_available = False
 
         # Initialize battery sensor with better error handling
-        self.battery = None
+        self.battery = BatteryMonitor(None)
         try:
-            self.battery = max1704x(self.i2c)
+            if self.bus is None:
+                raise OSError("no I2C bus")
+            self.battery.gauge = max1704x(self.i2c)
+            if BATTERY_ALERT_PIN is not None:
+                self.battery.enable_alerts(BATTERY_ALERT_PIN, BATTERY_ALERT_MIN_MV, BATTERY_ALERT_MAX_MV)
             # Test read to verify sensor is working
             soc, vcell = self.read_battery()
             if soc is None or vcell is None:
@@ -197,56 +309,27 @@ class BLENarmi:
             print(f"Battery sensor initialized: SOC={soc}%, Voltage={vcell}V")
         except Exception as e:
             print("Battery sensor initialization failed:", e)
-            self.battery = None
-
-        # Update service registration to include calibration characteristic
-        _ENV_SENSE_SERVICE = (
-            _ENV_SENSE_UUID,
-            (
-                _TEMP_CHAR,
-                _DISTANCE_CHAR,
-                _INTERVAL_CHAR,
-                _HUMIDITY_CHAR,
-                _CALIB_CHAR,  # Add calibration characteristic
-            ),
-        )
+            self.battery.gauge = None
 
-        # Update service registration tuple unpacking
-        (
-            (
-                self._temp_handle,
-                self._distance_handle,
-                self._interval_handle,
-                self._humidity_handle,
-                self._calib_handle,  # Add calibration handle
-            ),
-            (self._batt_level_handle, self._batt_volt_handle),
-        ) = self._ble.gatts_register_services(_SERVICES)
+    def _init_scheduler(self):
+        """Registers the sensors sampled by sample_sensors. A new IBaseSensorEx sensor only needs an add here."""
+        from app.sensor.scheduler import SensorScheduler, HCSR04Sensor, GaugeSensor
 
-        self._connections = set()
-        self._payload = advertising_payload(
-            name=name, services=[_ENV_SENSE_UUID], appearance=_ADV_APPEARANCE_GENERIC_THERMOMETER
-        )
-        self._pending_indications = {}  # Track pending indications
-        print("BLE Device initialized and ready to advertise")
-        self._advertise()
+        self.sensors = SensorScheduler(self.bus)
+        self._sht_slot = None
+        if self.sht_available:
+            self._sht_slot = self.sensors.add(
+                self.sht, _SHT40_ADDR, start_args=(False, 2), read=lambda: self.sht.get_measurement_raw(self.sht_raw)
+            )
+        self._distance_slot = self.sensors.add(HCSR04Sensor(self.distance, DISTANCE_PINGS), timeout_ms=50)
+        self._gauge_slot = None
+        if self.battery.gauge:
+            self._gauge_slot = self.sensors.add(GaugeSensor(self.battery, self._poll_battery), _MAX17048_ADDR)
 
     def _irq(self, event, data):
-        # Track connections so we can send notifications.
-        if event == _IRQ_CENTRAL_CONNECT:
-            conn_handle, _, _ = data
-            print("\nConnected to central device")
-            self._connections.add(conn_handle)
-            self.indicate_loop = self.loop.create_task(self.start_indicating())
-
-        elif event == _IRQ_CENTRAL_DISCONNECT:
-            self.indicate_loop.cancel()
-            conn_handle, _, _ = data
-            print("\nDisconnected from central device")
-            self._connections.remove(conn_handle)
-            self._save_secrets()
-            print("Starting advertising again...")
-            self._advertise()
+        # Connections, writes, indication confirmations and bond keys are handled by aioble
+        if event == _IRQ_CONNECTION_UPDATE:
+            self.link.update(*data)
         elif event == _IRQ_ENCRYPTION_UPDATE:
             conn_handle, encrypted, authenticated, bonded, key_size = data
             print("encryption update", conn_handle, encrypted, authenticated, bonded, key_size)
@@ -265,63 +348,55 @@ class BLENarmi:
                 self._ble.gap_passkey(conn_handle, action, passkey)
             else:
                 print("unknown action")
-        elif event == _IRQ_GATTS_INDICATE_DONE:
-            conn_handle, value_handle, status = data
-            if status == 0:
-                print(f" -> Indication confirmed (handle: {conn_handle})")
 
-            else:
-                print(f"Indication failed (handle: {conn_handle}, status: {status})")
-            if conn_handle in self._pending_indications:
-                del self._pending_indications[conn_handle]
-        elif event == _IRQ_SET_SECRET:
-            sec_type, key, value = data
-            key = sec_type, bytes(key)
-            value = bytes(value) if value else None
-            print("set secret:", key, value)
-            if value is None:
-                if key in self._secrets:
-                    del self._secrets[key]
-                    return True
-                else:
-                    return False
-            else:
-                self._secrets[key] = value
-            return True
-        elif event == _IRQ_GET_SECRET:
-            sec_type, index, key = data
-            print("get secret:", sec_type, index, bytes(key) if key else None)
-            if key is None:
-                i = 0
-                for (t, _key), value in self._secrets.items():
-                    if t == sec_type:
-                        if i == index:
-                            return value
-                        i += 1
-                return None
-            else:
-                key = sec_type, bytes(key)
-                return self._secrets.get(key, None)
-        # Add handler for write events
-        elif event == _IRQ_GATTS_WRITE:
-            conn_handle, attr_handle = data
-            if attr_handle == self._calib_handle:
-                # Read the written value
-                value = self._ble.gatts_read(self._calib_handle)
-                # Unpack calibration values
-                temp_calib = struct.unpack("<h", value[0:2])[0] / 100
-                humidity_calib = struct.unpack("<h", value[2:4])[0] / 100
-                print(f"Received calibration values: temp={temp_calib}°C, humidity={humidity_calib}%")
-
-                # Save to calibration file
-                with open("calibration.py", "w") as f:
-                    f.write(f"CALIB_TEMP = {temp_calib}\n")
-                    f.write(f"CALIB_HUMIDITY = {humidity_calib}\n")
-
-                # Optionally restart or update calibration immediately
-                global CALIB_TEMP, CALIB_HUMIDITY
-                CALIB_TEMP = temp_calib
-                CALIB_HUMIDITY = humidity_calib
+    async def _serve(self):
+        """Waits for a central and serves it in its own task until it disconnects, then advertises again"""
+        while True:
+            # restarts the advertisement _advertise started and returns once a central connected
+            connection = await aioble.advertise(_ADV_INTERVAL_US, adv_data=self._payload)
+            print("\nConnected to central device")
+            trace.end(trace.ADVERTISE)
+            trace.begin(trace.CONNECTED)
+            conn_handle = connection._conn_handle
+            self._connections.add(connection)
+            self._indications.open(connection)
+            self.link.open(connection)
+            self.indicate_loop = asyncio.create_task(self.start_indicating(connection))
+            transfer_task = asyncio.create_task(self.transfer.serve(connection)) if self.transfer else None
+
+            await connection.disconnected()
+            self.indicate_loop.cancel()
+            if transfer_task:
+                transfer_task.cancel()
+            print("\nDisconnected from central device")
+            trace.end(trace.CONNECTED)
+            self._connections.discard(connection)
+            self._indications.close(connection)
+            self.link.close(conn_handle)
+            self._save_secrets()
+            print("Starting advertising again...")
+            self._advertise()
+
+    async def _receive_calibration(self):
+        """Applies and stores the calibration values a central writes"""
+        global CALIB_TEMP, CALIB_HUMIDITY
+        while True:
+            await self._calib_char.written()
+            # Unpack calibration values
+            temp_calib_raw, humidity_calib_raw = struct.unpack_from("<hh", self._calib_char.read(), 0)
+            temp_calib = temp_calib_raw / 100
+            humidity_calib = humidity_calib_raw / 100
+            print(f"Received calibration values: temp={temp_calib}°C, humidity={humidity_calib}%")
+
+            # Save to calibration file
+            with open("calibration.py", "w") as f:
+                f.write(f"CALIB_TEMP = {temp_calib}\n")
+                f.write(f"CALIB_HUMIDITY = {humidity_calib}\n")
+
+            CALIB_TEMP = temp_calib
+            CALIB_HUMIDITY = humidity_calib
+            if self.sht:
+                self.sht.set_calibration_raw(temp_calib_raw, humidity_calib_raw)
 
     def btn_cb(self, args):
         btn = args[0]
@@ -330,142 +405,271 @@ class BLENarmi:
         self.USER_INTERACTED = time.ticks_ms()
         if btn == 2 and type == 0:
             self.SLEEP_FOR_MS = self.SLEEP_FOR_MS + 1000
-            self.set_interval(self.SLEEP_FOR_MS, indicate=True)
         elif btn == 1 and type == 0 and self.SLEEP_FOR_MS > 1000:
             self.SLEEP_FOR_MS = self.SLEEP_FOR_MS - 1000
+        else:
+            return
+        # on a radio-less wake only the interval is kept, start_radio publishes it
+        if self.radio:
             self.set_interval(self.SLEEP_FOR_MS, indicate=True)
 
-    def set_temperature(self, temp_deg_c, notify=False, indicate=False):
-        # Write the local value, ready for a central to read.
-        self._ble.gatts_write(self._temp_handle, struct.pack("<h", int(temp_deg_c * 100)))
+    def _publish(self, characteristic, value, notify, indicate, name):
+        # Write the local value, ready for a central to read, and push it to the connected centrals
+        characteristic.write(value)
         if notify or indicate:
-            for conn_handle in self._connections:
+            for connection in self._connections:
                 if notify:
-                    self._ble.gatts_notify(conn_handle, self._temp_handle)
-                    print("- Sending TEMPERATURE notify")
+                    characteristic.notify(connection)
                 if indicate:
-                    self._pending_indications[conn_handle] = time.ticks_ms()
-                    self._ble.gatts_indicate(conn_handle, self._temp_handle)
-                    print(f"- Sending TEMPERATURE indication (handle: {conn_handle})")
+                    # snapshot, the local value changes with the next reading
+                    self._indications.put_nowait(connection, characteristic, bytes(value))
+                    print(f"- Sending {name} indication (handle: {connection._conn_handle})")
+
+    def set_temperature(self, temp_deg_c, notify=False, indicate=False):
+        self._publish(self._temp_char, struct.pack("<h", round(temp_deg_c * 100)), notify, indicate, "TEMPERATURE")
 
     def measure_distance(self):
         return self.distance.measure_distance_cm()
 
     def set_distance(self, distance_cm, notify=False, indicate=False):
         # Pack distance as uint16 in mm
-        self._ble.gatts_write(self._distance_handle, struct.pack("<H", int(distance_cm * 10)))
-        if notify or indicate:
-            for conn_handle in self._connections:
-                if notify:
-                    self._ble.gatts_notify(conn_handle, self._distance_handle)
-                if indicate:
-                    self._pending_indications[conn_handle] = time.ticks_ms()
-                    self._ble.gatts_indicate(conn_handle, self._distance_handle)
-                    print(f"- Sending DISTANCE indication (handle: {conn_handle})")
+        self._publish(self._distance_char, struct.pack("<H", int(distance_cm * 10)), notify, indicate, "DISTANCE")
 
-    # Add new method to set interval
     def set_interval(self, interval_ms, notify=False, indicate=False):
-        self._ble.gatts_write(self._interval_handle, struct.pack("<I", interval_ms))
-        if notify or indicate:
-            for conn_handle in self._connections:
-                if notify:
-                    self._ble.gatts_notify(conn_handle, self._interval_handle)
-                if indicate:
-                    self._pending_indications[conn_handle] = time.ticks_ms()
-                    self._ble.gatts_indicate(conn_handle, self._interval_handle)
-                    print(f"- Sending INTERVAL indication (handle: {conn_handle})")
+        self._publish(self._interval_char, struct.pack("<I", interval_ms), notify, indicate, "INTERVAL")
 
     def set_humidity(self, humidity, notify=False, indicate=False):
         # Write humidity value (scaled by 100 to preserve 2 decimal places)
-        self._ble.gatts_write(self._humidity_handle, struct.pack("<H", int(humidity * 100)))
-        if notify or indicate:
-            for conn_handle in self._connections:
-                if notify:
-                    self._ble.gatts_notify(conn_handle, self._humidity_handle)
-                if indicate:
-                    self._pending_indications[conn_handle] = time.ticks_ms()
-                    self._ble.gatts_indicate(conn_handle, self._humidity_handle)
-                    print(f"- Sending HUMIDITY indication (handle: {conn_handle})")
+        self._publish(self._humidity_char, struct.pack("<H", round(humidity * 100)), notify, indicate, "HUMIDITY")
 
     def set_battery_level(self, level, notify=False, indicate=False):
         """Set battery level (0-100%)"""
-        self._ble.gatts_write(self._batt_level_handle, struct.pack("<B", int(level)))
-        if notify or indicate:
-            for conn_handle in self._connections:
-                if notify:
-                    self._ble.gatts_notify(conn_handle, self._batt_level_handle)
-                if indicate:
-                    self._pending_indications[conn_handle] = time.ticks_ms()
-                    self._ble.gatts_indicate(conn_handle, self._batt_level_handle)
-                    print(f"- Sending BATTERY LEVEL indication (handle: {conn_handle})")
+        self._publish(self._batt_level_char, struct.pack("<B", int(level)), notify, indicate, "BATTERY LEVEL")
 
     def set_battery_voltage(self, voltage, notify=False, indicate=False):
         """Set battery voltage (in mV)"""
-        self._ble.gatts_write(self._batt_volt_handle, struct.pack("<H", int(voltage * 1000)))
-        if notify or indicate:
-            for conn_handle in self._connections:
-                if notify:
-                    self._ble.gatts_notify(conn_handle, self._batt_volt_handle)
-                if indicate:
-                    self._pending_indications[conn_handle] = time.ticks_ms()
-                    self._ble.gatts_indicate(conn_handle, self._batt_volt_handle)
-                    print(f"- Sending BATTERY VOLTAGE indication (handle: {conn_handle})")
+        self._publish(self._batt_volt_char, struct.pack("<H", int(voltage * 1000)), notify, indicate, "BATTERY VOLTAGE")
+
+    def set_record(self, temp, humidity, distance_cm, batt_level, notify=False, indicate=False):
+        """Write every field of one reading as a packed record (see app/record.py).
+        Legacy per-field characteristics are updated too, so centrals can still read them."""
+        if temp is not None:
+            self.set_temperature(temp)
+            self.set_humidity(humidity)
+        self.set_distance(distance_cm)
+        if batt_level is not None:
+            self.set_battery_level(batt_level)
+        self.set_interval(self.SLEEP_FOR_MS)
+
+        seq = self.backlog.take_seq()
+        ts = time.time()
+        raw = raw_values(temp, humidity, distance_cm, batt_level)
+        pack_record_raw(self._record_buf, seq, ts, *raw, self.SLEEP_FOR_MS)
+        self.log_history(ts, *raw)
+        self._policy_reading(raw)
+        self._publish(self._record_char, self._record_buf, notify, indicate, "RECORD")
+
+    def log_history(self, ts, temp_raw, humidity_raw, distance_mm, batt_raw):
+        """Append a reading to the on-flash history log, flushed every HISTORY_FLUSH_EVERY readings
+        and by history.close() before sleep"""
+        if not self.history:
+            return
+        try:
+            self.history.append(ts, temp_raw, humidity_raw, distance_mm, batt_raw)
+            self._history_pending += 1
+            if self._history_pending >= HISTORY_FLUSH_EVERY:
+                self.history.flush()
+                self._history_pending = 0
+        except OSError as e:
+            print("History log write failed:", e)
+
+    async def buffer_reading(self):
+        """Sample all sensors and keep the reading in the RTC backlog for the next connection"""
+        temp, humidity, distance, batt_level, _ = await self.sample_sensors()
+        ts = time.time()
+        raw = raw_values(temp, humidity, distance, batt_level)
+        seq = self.backlog.append(ts, *raw)
+        self.log_history(ts, *raw)
+        self._policy_reading(raw)
+        print(f"     [BACKLOG] Stored reading {seq}, {len(self.backlog)} waiting")
+        return raw
+
+    def _policy_reading(self, raw):
+        # a reading taken with the radio up restarts the policy's wake count and thresholds
+        if self.policy and self.radio:
+            self.policy.radio_up(raw[0], raw[2])
+
+    async def sample_wake(self) -> bool:
+        """Radio-less wake: buffer a reading, then start the radio if the policy asks for a sync.
+        Returns False when this wake should go back to sleep."""
+        raw = await self.buffer_reading()
+        if self._beacon:
+            await self.broadcast(raw)
+        temp_raw, _, distance_mm, _ = raw
+        if self.policy and not self.policy.crossed(temp_raw, distance_mm):
+            print(f"     [WAKE] {self.policy.since_radio}/{self.policy.every_n} wakes without radio")
+            return False
+        print("     [WAKE] Threshold crossed, starting the radio")
+        self.start_radio()
+        return True
+
+    async def broadcast(self, raw):
+        """Sends the reading just buffered (record units) as a non-connectable beacon for BEACON_BURST_MS"""
+        trace.begin(trace.BEACON)
+        self._ble.active(True)
+        payload = self._beacon.payload((self.backlog.next_seq - 1) & 0xFFFF, *raw)
+        try:
+            await aioble.advertise(BEACON_INTERVAL_US, adv_data=payload, connectable=False, timeout_ms=BEACON_BURST_MS)
+        except asyncio.TimeoutError:
+            # the burst is over, aioble stopped advertising
+            pass
+        trace.end(trace.BEACON)
+
+    async def indicate(self, characteristic, data=None):
+        """Queue an indication to every connection, waiting while a connection's queue is full"""
+        for connection in tuple(self._connections):
+            await self._indications.put(connection, characteristic, data)
+
+    async def drain_backlog(self):
+        """Send every buffered reading as a record flagged RECORD_FLAG_BACKLOG, oldest first, as many records
+        per indication as the smallest ATT MTU of the connections allows.
+        The indication queue paces this at the rate confirmations come back.
+        A reading is removed only after it was queued, so a disconnect keeps the rest for next time."""
+        sent = 0
+        if not self._connections:
+            return
+        per_indication = max(min(self.link.payload(c) for c in self._connections) // RECORD_SIZE, 1)
+        batch = bytearray(per_indication * RECORD_SIZE)
+        trace.begin(trace.BACKLOG)
+        while len(self.backlog) and self._connections:
+            n = 0
+            for seq, ts, temp, humidity, distance, batt_level in self.backlog:
+                pack_record_raw(
+                    batch,
+                    seq,
+                    ts,
+                    temp,
+                    humidity,
+                    distance,
+                    batt_level,
+                    self.SLEEP_FOR_MS,
+                    RECORD_FLAG_BACKLOG,
+                    n * RECORD_SIZE,
+                )
+                n += 1
+                if n == per_indication:
+                    break
+            await self.indicate(self._record_char, bytes(memoryview(batch)[: n * RECORD_SIZE]))
+            for _ in range(n):
+                self.backlog.pop()
+            sent += n
+        trace.end(trace.BACKLOG)
+        if sent:
+            print(f"     [BACKLOG] Sent {sent} buffered readings")
+
+    async def indicate_legacy(self):
+        """Indicate the per-field characteristics one by one, for centrals without record support"""
+        for characteristic in (
+            self._distance_char,
+            self._temp_char,
+            self._humidity_char,
+            self._batt_level_char,
+            self._interval_char,
+        ):
+            await self.indicate(characteristic)
+
+    def _poll_battery(self):
+        # with gauge alerts, a plain timer wake reuses the cached reading: the gauge would have woken us
+        return BATTERY_ALERT_PIN is None or self.policy is None or self.policy.reason != WAKE_TIMER
 
     def read_battery(self):
-        """Read battery values from MAX17048 with better error handling"""
-        if not self.battery:
+        """Read battery values from MAX17048 (VCELL and SOC in one transaction) with better error handling"""
+        if not self.battery.gauge:
             return None, None
 
         try:
-            soc = self.battery.getSoc()
-            vcell = self.battery.getVCell()
+            trace.begin(trace.MAX17048)
+            soc, vcell = self.bus.run(_MAX17048_ADDR, self.battery.read, self._poll_battery())
+            trace.end(trace.MAX17048)
             # # Validate readings are within reasonable ranges
             # if not (0 <= soc <= 100 and 2.5 <= vcell <= 4.5):
             #     print("Battery readings out of valid range")
             #     return None, None
             # print("     Battery SOC: ", soc, "VCell: ", vcell)
             return soc, vcell
+        except OSError as e:
+            # bus error, the bus quarantines the gauge if it keeps failing
+            print("Battery read error:", e)
+            trace.count(trace.C_SENSOR_ERROR)
+            return None, None
         except Exception as e:
             print("Battery read error:", e)
+            trace.count(trace.C_SENSOR_ERROR)
 
             print(sys.print_exception(e))
-            self.battery = None  # Mark sensor as failed
-            return None, None
-
-    @i2c_retry(retries=3, delay_ms=100)
-    def read_sht40(self):
-        """Read temperature and humidity with retry logic"""
-        if not self.sht_available:
+            self.battery.gauge = None  # Mark sensor as failed
             return None, None
 
-        try:
-            self.sht.start_measurement(with_heater=False, value=2)
-            time.sleep_us(self.sht.get_conversion_cycle_time())
-            results = self.sht.get_measurement_value()
-            if results:
-                temp, humidity = results
-                # Validate readings are within reasonable ranges
-                if -40 <= temp <= 125 and 0 <= humidity <= 100:
-                    temp = temp + CALIB_TEMP
-                    humidity = humidity + CALIB_HUMIDITY
-                    return temp, humidity
-                else:
-                    print("Invalid sensor readings detected")
-                    return None, None
-            return None, None
-        except Exception as e:
-            print("SHT40 read error:", e)
-            return None, None
-
-    def _advertise(self, interval_us=200000):
+    def _check_sht40(self, ok):
+        """Validate the fixed-point SHT40 result in self.sht_raw (calibration is applied by the driver)"""
+        if ok:
+            temp_raw, humidity_raw = self.sht_raw
+            # Validate readings are within reasonable ranges
+            if -4000 <= temp_raw <= 12500:
+                return temp_raw / 100, humidity_raw / 100
+            print("Invalid sensor readings detected")
+        return None, None
+
+    async def sample_sensors(self):
+        """Sample all sensors concurrently through self.sensors: the HCSR04 burst and the MAX17048 read overlap
+        the SHT40 conversion, each sensor is read as soon as it is ready.
+        Returns (temp, humidity, distance, batt_level, batt_voltage).
+        Per-sensor latency in us is kept in self.sample_latency_us (SHT40, HCSR04, MAX17048, total)."""
+        latency = self.sample_latency_us
+        trace.begin(trace.SAMPLE)
+        t_start = time.ticks_us()
+        if self.bus:
+            self.bus.new_cycle()
+        values = await self.sensors.sample()
+
+        # median echo of a ping burst, converted once the temperature is known
+        echo_us = values[self._distance_slot] or 0
+        if self.distance.confidence != CONFIDENCE_HIGH:
+            print("     Distance confidence low:", self.distance.confidence)
+
+        batt_level, batt_voltage = None, None
+        if self._gauge_slot is not None and self.battery.gauge and values[self._gauge_slot]:
+            batt_level, batt_voltage = values[self._gauge_slot]
+
+        temp, humidity = None, None
+        if self._sht_slot is not None:
+            # the bus already retried a failed read, a failed conversion waits for the next cycle
+            temp, humidity = self._check_sht40(bool(values[self._sht_slot]))
+        # speed of sound compensated with this reading, in cm like measure_distance
+        if temp is None:
+            distance = echo_to_mm(echo_us) / 10
+        else:
+            distance = echo_to_mm(echo_us, self.sht_raw[0], self.sht_raw[1]) / 10
+
+        for i, slot in enumerate((self._sht_slot, self._distance_slot, self._gauge_slot)):
+            latency[i] = 0 if slot is None else self.sensors.latency_us[slot]
+        latency[3] = time.ticks_diff(time.ticks_us(), t_start)
+        trace.end(trace.SAMPLE)
+        return temp, humidity, distance, batt_level, batt_voltage
+
+    def _advertise(self, interval_us=_ADV_INTERVAL_US):
         mac = self._ble.config("mac")
         mac_address_str = ":".join([f"{b:02x}" for b in mac[1]])
         print("\nStarting BLE advertising with address:", mac_address_str)
         self._payload = advertising_payload(
             name=self._name, services=[_ENV_SENSE_UUID], appearance=_ADV_APPEARANCE_GENERIC_THERMOMETER
         )
+        trace.begin(trace.ADVERTISE)
         self._ble.gap_advertise(interval_us, adv_data=self._payload)
         self.ADVERTIZING_TIME_MS = time.ticks_ms()
+        if self.boot_to_advertise_ms is None:
+            self.boot_to_advertise_ms = self.ADVERTIZING_TIME_MS
+            print(f"Boot to advertise: {self.boot_to_advertise_ms} ms")
 
     def blink_led(self, times, delay):
         for _ in range(times):
@@ -475,37 +679,57 @@ class BLENarmi:
             time.sleep_ms(delay)
 
     def _reset_secrets(self):
-        self._secrets = []
+        security.secrets().clear()
         self._save_secrets()
 
     def _load_secrets(self):
-        self._secrets = {}
-        try:
-            with open("secrets.json", "r") as f:
-                entries = json.load(f)
-                for sec_type, key, value in entries:
-                    self._secrets[sec_type, binascii.a2b_base64(key)] = binascii.a2b_base64(value)
-        except:
-            print("no secrets available")
+        # aioble's security module answers the stack's secret requests from a KeyStore
+        security.set_store(KeyStore)
+        security.load_secrets()
+        print(f"{len(security.secrets())} bond keys loaded")
 
     def _save_secrets(self):
+        """Write the bond keys, only if a key changed since the last save"""
         try:
-            with open("secrets.json", "w") as f:
-                json_secrets = [
-                    (sec_type, binascii.b2a_base64(key), binascii.b2a_base64(value))
-                    for (sec_type, key), value in self._secrets.items()
-                ]
-                json.dump(json_secrets, f)
-        except:
-            print("failed to save secrets")
+            if security.save_secrets():
+                print("Bond keys saved")
+        except OSError as e:
+            print("failed to save secrets:", e)
 
     async def check_buttons(self):
         while True:
             await asyncio.sleep_ms(500)
             print("Checking buttons", Pin(BTN_DOWN).value(), Pin(BTN_UP).value())
 
+    def publish_trace(self):
+        """Expose the wake-cycle trace summary and the battery estimate on the diagnostic characteristics"""
+        if self.radio:
+            self._trace_char.write(trace.summary())
+            self._batt_est_char.write(self.battery.summary(self._batt_est_buf))
+
+    def tune_sleep(self):
+        """Picks the next sleep interval for BATTERY_TARGET_DAYS from the measured discharge rate"""
+        if not BATTERY_TARGET_DAYS or not self.battery.cached:
+            return
+        self.SLEEP_FOR_MS = self.battery.pick_sleep_ms(
+            self.SLEEP_FOR_MS,
+            BATTERY_TARGET_DAYS,
+            BATTERY_CAPACITY_MAH,
+            SLEEP_UA,
+            BATTERY_MIN_SLEEP_MS,
+            BATTERY_MAX_SLEEP_MS,
+        )
+
     def falling_asleep(self):
         print("Going to sleep")
+        trace.begin(trace.SLEEP)
+        self.backlog.commit()
+        if self.history:
+            self.history.close()
+        trace.end(trace.SLEEP)
+        if ENABLE_SLEEP:
+            self.tune_sleep()
+        self.publish_trace()
         self.led.off()
         time.sleep_ms(100)
         if ENABLE_SLEEP:
@@ -517,6 +741,9 @@ class BLENarmi:
             await asyncio.sleep_ms(200)
             self.led.off()
             await asyncio.sleep_ms(300)
+            if self.transfer and not self.transfer.idle.is_set():
+                # a history download holds the wake
+                continue
             if self.USER_INTERACTED > 0:
                 after_ineteracted = time.ticks_diff(time.ticks_ms(), self.USER_INTERACTED)
                 if after_ineteracted >= NO_INTERACTION:
@@ -526,14 +753,19 @@ class BLENarmi:
                 after_advertizing = time.ticks_diff(time.ticks_ms(), self.ADVERTIZING_TIME_MS)
                 if after_advertizing >= ADVERTIZING_LIMIT_MS:
                     self.ADVERTIZING_TIME_MS = time.ticks_ms()
+                    if not self._connections:
+                        # nobody collected this wake's reading, keep it for the next connection
+                        await self.buffer_reading()
                     self.falling_asleep()
 
     async def loops(self):
-        # self.indicate_loop = self.loop.create_task(self.start_indicating())
+        if not self.radio and not await self.sample_wake():
+            self.falling_asleep()
         ps = self.loop.create_task(self.go_sleep())
         self.loop.run_forever()
 
     def start(self):
+        from app.driver.iqsbuttons import IQSButtons
 
         self.btns = IQSButtons(self.btn_cb, BTN_DOWN, BTN_UP, loop=self.loop)
         # temp_task = self.loop.create_task(self.check_buttons())
@@ -548,23 +780,19 @@ class BLENarmi:
         finally:
             self.loop.close()
 
-    async def start_indicating(self):
-        indicated = 0
-        indivcate_intv = 50
-        while True:
-            if len(self._connections) == 0:
-                continue
+    async def start_indicating(self, connection):
+        """Serves one connection: sends the backlog and INDICATE_TIMES readings per wake.
+        Cancelled by _serve when the central disconnects."""
+        await self.link.exchange_mtu(connection)
+        while connection.is_connected():
+            self.link.phase(connection, SYNC)
             try:
-                temp, humidity = self.read_sht40()
-                distance = self.measure_distance()
-                batt_level, batt_voltage = self.read_battery()
+                temp, humidity, distance, batt_level, batt_voltage = await self.sample_sensors()
             except Exception as e:
                 print("Error on sensor:", e)
                 sys.print_exception(e)
                 await asyncio.sleep_ms(200)
-                temp, humidity = self.read_sht40()
-                distance = self.measure_distance()
-                batt_level, batt_voltage = self.read_battery()
+                temp, humidity, distance, batt_level, batt_voltage = await self.sample_sensors()
 
             print(
                 "     [BLE] Temp:",
@@ -577,30 +805,36 @@ class BLENarmi:
                 batt_level,
                 ", Interval:",
                 self.SLEEP_FOR_MS,
+                ", Latency us (sht, dist, batt, total):",
+                self.sample_latency_us,
             )
             try:
-                await asyncio.sleep_ms(1000)
+                await self.drain_backlog()
                 for i in range(INDICATE_TIMES):
-                    await asyncio.sleep_ms(indivcate_intv)
-                    self.set_distance(distance, notify=False, indicate=True)
-                    await asyncio.sleep_ms(indivcate_intv)
-                    self.set_temperature(temp, notify=False, indicate=True)
-                    await asyncio.sleep_ms(indivcate_intv)
-                    self.set_humidity(humidity, notify=False, indicate=True)
-                    await asyncio.sleep_ms(indivcate_intv)
-                    self.set_battery_level(batt_level, notify=False, indicate=True)
-                    await asyncio.sleep_ms(indivcate_intv)
-                    self.set_interval(self.SLEEP_FOR_MS, notify=False, indicate=True)
-                    temp, humidity = self.read_sht40()
-                    distance = self.measure_distance()
-                    batt_level, batt_voltage = self.read_battery()
+                    self.set_record(temp, humidity, distance, batt_level)
+                    await self.indicate(self._record_char, bytes(self._record_buf))
+                    if LEGACY_INDICATE:
+                        await self.indicate_legacy()
+                    temp, humidity, distance, batt_level, batt_voltage = await self.sample_sensors()
+                await self._indications.wait_idle(connection)
+                if self.transfer:
+                    await self.transfer.idle.wait()
+                self.publish_trace()
+                print(
+                    "     [BLE] Indications confirmed:",
+                    self._indications.confirmed,
+                    ", retried:",
+                    self._indications.retried,
+                    ", dropped:",
+                    self._indications.dropped,
+                )
                 gc.collect()
             except Exception as e:
                 print("Error in start_indicating loop:", e)
                 sys.print_exception(e)
-                indicated = 0
 
             self.falling_asleep()
+            self.link.phase(connection, IDLE)
             await asyncio.sleep_ms(self.SLEEP_FOR_MS)
 
 
@@ -0,0 +1,165 @@
+"""Wake-cycle phase profiler.
+
+Spans are ticks_us timings of the phases below, kept in a preallocated array-backed ring, so
+begin()/end()/count() allocate nothing on the hot path. Read the trace from the REPL:
+    import app.trace as trace
+    trace.dump()
+or over BLE: summary() is the last duration (us) of every phase followed by every counter,
+as little endian u32 values in the order of PHASES and COUNTERS.
+Works on the unix port (and CPython) for host benchmarks.
+"""
+
+import time
+from array import array
+
+try:
+    from micropython import const
+except ImportError:
+    # CPython
+    def const(x):
+        return x
+
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:
+    # CPython
+    def ticks_us():
+        return int(time.perf_counter() * 1_000_000) & 0x3FFFFFFF
+
+    def ticks_diff(a, b):
+        return ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+
+
+# phases
+BOOT = const(0)  # boot.py until the application is imported
+IMPORT = const(1)  # import of app.start
+BLE_INIT = const(2)  # BLENarmi.start_radio: BLE activation and service registration, until ready to advertise
+ADVERTISE = const(3)  # advertising until a central connects
+CONNECTED = const(4)  # connection until disconnect
+SAMPLE = const(5)  # whole sampling stage
+SHT40 = const(6)  # SHT40 start of measurement until value read
+HCSR04 = const(7)  # ultrasonic ping
+MAX17048 = const(8)  # fuel gauge read
+INDICATE = const(9)  # indication sent until confirmed
+BACKLOG = const(10)  # backlog drain
+SLEEP = const(11)  # preparing for deepsleep
+HISTORY = const(12)  # one history download over L2CAP, see app/history_transfer.py
+MTU = const(13)  # ATT MTU exchange after connect, see app/link.py
+BEACON = const(14)  # non-connectable beacon burst, see app/beacon.py
+PHASES = (
+    "boot",
+    "import",
+    "ble_init",
+    "advertise",
+    "connected",
+    "sample",
+    "sht40",
+    "hcsr04",
+    "max17048",
+    "indicate",
+    "backlog",
+    "sleep",
+    "history",
+    "mtu",
+    "beacon",
+)
+
+# counters
+C_WAKE = const(0)
+C_SENSOR_ERROR = const(1)
+C_INDICATE_OK = const(2)
+C_INDICATE_FAIL = const(3)
+C_I2C_ERROR = const(4)  # failed I2C transaction attempts, see app/i2c_bus.py
+C_I2C_RECOVER = const(5)  # I2C bus recoveries
+C_CONN_UPDATE = const(6)  # connection parameter updates applied by a central
+COUNTERS = ("wake", "sensor_error", "indicate_ok", "indicate_fail", "i2c_error", "i2c_recover", "conn_update")
+
+_CAPACITY = const(64)
+
+_phase = array("B", bytes(_CAPACITY))
+_start = array("I", bytes(4 * _CAPACITY))
+_duration = array("I", bytes(4 * _CAPACITY))
+_head = 0
+_count = 0
+_N_PHASES = len(PHASES)  # counters follow the phases in _summary
+_open = array("I", bytes(4 * _N_PHASES))  # begin timestamps
+_opened = bytearray(_N_PHASES)  # 1 between begin() and end()
+_summary = array("I", bytes(4 * (_N_PHASES + len(COUNTERS))))  # last durations, then counters
+
+enabled = True
+
+
+def begin(phase: int):
+    _open[phase] = ticks_us()
+    _opened[phase] = 1
+
+
+def end(phase: int):
+    """Records the span since begin(phase). Without a matching begin() nothing is recorded."""
+    if _opened[phase]:
+        _opened[phase] = 0
+        span(phase, _open[phase])
+
+
+def span(phase: int, start: int):
+    """Records a span of phase that began at start (ticks_us) and ends now"""
+    global _head, _count
+    if not enabled:
+        return
+    duration = ticks_diff(ticks_us(), start)
+    if duration < 0:
+        # start in the future
+        return
+    i = _head
+    _phase[i] = phase
+    _start[i] = start
+    _duration[i] = duration
+    _summary[phase] = duration
+    _head = (i + 1) % _CAPACITY
+    if _count < _CAPACITY:
+        _count += 1
+
+
+def count(counter: int, n: int = 1):
+    _summary[_N_PHASES + counter] += n
+
+
+def counter(counter: int) -> int:
+    return _summary[_N_PHASES + counter]
+
+
+def last(phase: int) -> int:
+    """Last duration of phase in us"""
+    return _summary[phase]
+
+
+def summary() -> memoryview:
+    """Last duration of every phase, then every counter, as u32 (see module docstring)"""
+    return memoryview(_summary)
+
+
+def spans():
+    """Yields (phase name, start ticks_us, duration us), oldest first"""
+    first = (_head - _count) % _CAPACITY
+    for n in range(_count):
+        i = (first + n) % _CAPACITY
+        yield PHASES[_phase[i]], _start[i], _duration[i]
+
+
+def clear():
+    global _head, _count
+    _head = _count = 0
+    for i in range(len(_summary)):
+        _summary[i] = 0
+    for i in range(_N_PHASES):
+        _opened[i] = 0
+
+
+def dump():
+    """Prints the span ring and the per-phase summary"""
+    for name, start, duration in spans():
+        print(f"{start:>10} {name:<10} {duration:>9} us")
+    print("last:", ", ".join(f"{name}={_summary[i]}" for i, name in enumerate(PHASES)))
+    print("counters:", ", ".join(f"{name}={_summary[_N_PHASES + i]}" for i, name in enumerate(COUNTERS)))
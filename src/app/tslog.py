@@ -0,0 +1,210 @@
+"""Append-only time-series log of readings on the flash filesystem.
+
+Readings are fixed-size records in the integer units of app/record.py:
+    timestamp u32 (s), temperature i16 (centi-degrees), humidity u16 (centi-%RH),
+    distance u16 (mm), battery u8 (%)
+They are appended to segment files "segNNNNN.bin" inside one directory. A segment is closed
+after segment_records records; only the newest max_segments segments are kept, so old data is
+dropped a whole file at a time and writes move on to fresh blocks. Every closed segment has an
+entry (id, first timestamp, last timestamp, count) in "index.bin", which is rewritten atomically
+(temp file + rename) only when a segment is closed. A range query picks segments from the index and
+binary searches inside them, so nothing is scanned.
+Timestamps are expected to grow. If one goes backwards (clock reset), a new segment is started.
+"""
+
+import os
+import struct
+from micropython import const
+
+RECORD_FORMAT = "<IhHHB"
+RECORD_SIZE = const(11)
+_INDEX_FORMAT = "<HIII"  # segment id, first timestamp, last timestamp, record count
+_INDEX_ENTRY_SIZE = const(14)
+_INDEX_FILE = "index.bin"
+
+
+def _exists(path: str) -> bool:
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+class TimeSeriesLog:
+    """Segmented append-only log with a per-segment time index"""
+
+    def __init__(self, directory: str, segment_records: int = 4096, max_segments: int = 8):
+        self._dir = directory
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self._buf = bytearray(RECORD_SIZE)
+        self._file = None  # active segment, opened on first append
+        if not _exists(directory):
+            os.mkdir(directory)
+        # closed segments: [id, first_ts, last_ts, count]
+        self._index = self._load_index()
+        # active segment
+        self._active_id = (self._index[-1][0] + 1) & 0xFFFF if self._index else 0  # wraps like _close_active
+        self._active_first = self._active_last = 0
+        self._active_count = 0
+        self._open_active()
+
+    def _path(self, name: str) -> str:
+        return self._dir + "/" + name
+
+    def _segment_path(self, seg_id: int) -> str:
+        return self._path(f"seg{seg_id:05d}.bin")
+
+    def _load_index(self) -> list:
+        index = []
+        try:
+            with open(self._path(_INDEX_FILE), "rb") as f:
+                data = f.read()
+        except OSError:
+            return index
+        for offset in range(0, len(data) - _INDEX_ENTRY_SIZE + 1, _INDEX_ENTRY_SIZE):
+            index.append(list(struct.unpack_from(_INDEX_FORMAT, data, offset)))
+        return index
+
+    def _save_index(self):
+        tmp = self._path(_INDEX_FILE + ".tmp")
+        entry = bytearray(_INDEX_ENTRY_SIZE)
+        with open(tmp, "wb") as f:
+            for seg in self._index:
+                struct.pack_into(_INDEX_FORMAT, entry, 0, *seg)
+                f.write(entry)
+        os.rename(tmp, self._path(_INDEX_FILE))
+
+    def _open_active(self):
+        """Recovers the state of the active segment after a restart"""
+        path = self._segment_path(self._active_id)
+        if not _exists(path):
+            return
+        size = os.stat(path)[6]
+        count = size // RECORD_SIZE
+        if not count:
+            # empty, or only a torn first record (power loss): start the segment over under the same id
+            os.remove(path)
+            return
+        with open(path, "rb") as f:
+            self._active_first = self._read_ts(f, 0)
+            self._active_last = self._read_ts(f, count - 1)
+        self._active_count = count
+        if size % RECORD_SIZE or count >= self.segment_records:
+            # torn write at the end (power loss) or full: do not append behind it
+            self._close_active()
+
+    def _read_ts(self, f, n: int) -> int:
+        f.seek(n * RECORD_SIZE)
+        f.readinto(self._buf)
+        return struct.unpack_from("<I", self._buf, 0)[0]
+
+    def _close_active(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._active_count:
+            self._index.append([self._active_id, self._active_first, self._active_last, self._active_count])
+            while len(self._index) >= self.max_segments:
+                seg = self._index.pop(0)
+                try:
+                    os.remove(self._segment_path(seg[0]))
+                except OSError:
+                    pass
+            self._save_index()
+        self._active_id = (self._active_id + 1) & 0xFFFF
+        self._active_count = 0
+
+    def append(self, timestamp: int, temp_raw: int, humidity_raw: int, distance_mm: int, battery_raw: int):
+        """Appends one reading. Call flush() (or close()) to make it durable."""
+        if self._active_count and (self._active_count >= self.segment_records or timestamp < self._active_last):
+            self._close_active()
+        if self._file is None:
+            self._file = open(self._segment_path(self._active_id), "ab")
+        struct.pack_into(RECORD_FORMAT, self._buf, 0, timestamp, temp_raw, humidity_raw, distance_mm, battery_raw)
+        self._file.write(self._buf)
+        if not self._active_count:
+            self._active_first = timestamp
+        self._active_last = timestamp
+        self._active_count += 1
+
+    def flush(self):
+        if self._file:
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __len__(self) -> int:
+        n = self._active_count
+        for seg in self._index:
+            n += seg[3]
+        return n
+
+    def segments(self) -> list:
+        """Returns [id, first_ts, last_ts, count] for every segment, oldest first, including the active one"""
+        result = list(self._index)
+        if self._active_count:
+            result.append([self._active_id, self._active_first, self._active_last, self._active_count])
+        return result
+
+    def _lower_bound(self, f, count: int, timestamp: int) -> int:
+        """Index of the first record in an open segment with ts >= timestamp"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._read_ts(f, mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _span(self, f, first: int, last: int, count: int, since: int, until: int) -> tuple:
+        """(first index, end index) of the records of an open segment with since <= timestamp <= until"""
+        n = self._lower_bound(f, count, since) if first < since else 0
+        end = count if last <= until else self._lower_bound(f, count, until + 1)
+        return n, end
+
+    def count(self, since: int = 0, until: int = 0xFFFFFFFF) -> int:
+        """Number of records with since <= timestamp <= until. Only segments cut by the range are opened."""
+        self.flush()
+        total = 0
+        for seg_id, first, last, count in self.segments():
+            if last < since or first > until:
+                continue
+            if since <= first and last <= until:
+                total += count
+                continue
+            with open(self._segment_path(seg_id), "rb") as f:
+                n, end = self._span(f, first, last, count, since, until)
+            total += end - n
+        return total
+
+    def read_chunks(self, buf, since: int = 0, until: int = 0xFFFFFFFF):
+        """Yields the number of valid bytes each time buf is filled with packed records (RECORD_FORMAT)
+        with since <= timestamp <= until, oldest first. buf is reused, so consume it before the next step.
+        len(buf) should be a multiple of RECORD_SIZE."""
+        self.flush()
+        mv = memoryview(buf)
+        per_chunk = len(buf) // RECORD_SIZE
+        for seg_id, first, last, count in self.segments():
+            if last < since or first > until:
+                continue
+            with open(self._segment_path(seg_id), "rb") as f:
+                n, end = self._span(f, first, last, count, since, until)
+                f.seek(n * RECORD_SIZE)
+                while n < end:
+                    k = min(per_chunk, end - n)
+                    f.readinto(mv[: k * RECORD_SIZE])
+                    n += k
+                    yield k * RECORD_SIZE
+
+    def since(self, since: int, until: int = 0xFFFFFFFF):
+        """Yields (timestamp, temp_raw, humidity_raw, distance_mm, battery_raw) with since <= timestamp <= until"""
+        buf = bytearray(RECORD_SIZE * 32)
+        for size in self.read_chunks(buf, since, until):
+            for offset in range(0, size, RECORD_SIZE):
+                yield struct.unpack_from(RECORD_FORMAT, buf, offset)
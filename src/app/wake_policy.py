@@ -0,0 +1,123 @@
+"""Decides on which deepsleep wakes the radio is brought up.
+
+Every wake samples the sensors and keeps the reading in the RTC backlog (app/rtc_ring.py).
+BLE is only started to sync the backlog when
+    - the device was reset, woken by a button (ext1) or by a fuel gauge alert (ext0)
+    - every_n timer wakes have passed since the radio was last up
+    - temperature or distance moved by at least temp_delta / distance_delta since then
+Other wakes go straight back to deepsleep. The state is kept in its own RTC memory region:
+    magic u16, version u8, flags u8, wakes u32, wakes since radio u16,
+    reference temperature i16 (centi-degrees), reference distance u16 (mm), reserved u16
+"""
+
+import struct
+from micropython import const
+from app import rtc_memory
+
+try:
+    import machine
+except ImportError:
+    machine = None
+
+WAKE_RESET = const(0)  # power on, hard reset, brownout, ...
+WAKE_TIMER = const(1)
+WAKE_BUTTON = const(2)
+WAKE_BATTERY = const(3)  # fuel gauge alert (ext0), see app/battery.py
+
+_MAGIC = const(0x5057)
+_VERSION = const(1)
+_FORMAT = "<HBBIHhHH"
+_FLAG_REFERENCE = const(0x01)  # reference values are set
+_TEMP_UNKNOWN = const(0x7FFF)  # app/record.py TEMP_UNKNOWN
+
+# Power model. PLACEHOLDERS: ESP32 datasheet-typical figures, not measured on this board.
+# Replace them with measured currents before reading anything absolute into estimate_ua.
+SLEEP_UA = 150  # placeholder, deepsleep including the regulator, fuel gauge and sensor quiescent current
+SAMPLE_MA = 45  # placeholder, CPU awake without the radio
+SAMPLE_MS = 400  # placeholder, boot, sampling and going back to sleep
+RADIO_MA = 80  # placeholder, CPU awake with BLE advertising or connected
+
+
+def wake_reason() -> int:
+    """Returns WAKE_RESET, WAKE_TIMER, WAKE_BUTTON or WAKE_BATTERY"""
+    if machine is None or machine.reset_cause() != machine.DEEPSLEEP_RESET:
+        return WAKE_RESET
+    reason = machine.wake_reason()
+    if reason == machine.EXT1_WAKE:
+        return WAKE_BUTTON
+    if reason == machine.EXT0_WAKE:
+        return WAKE_BATTERY
+    return WAKE_TIMER
+
+
+def estimate_ua(every_n: int, sleep_s: int, radio_ms: int, sample_ms: int = SAMPLE_MS) -> float:
+    """Average current in uA of the placeholder power model when the radio is up for radio_ms on every
+    every_n-th wake. Only good for comparing policies with each other, not as a battery life figure."""
+    cycle_ms = every_n * (sleep_s * 1000 + sample_ms) + radio_ms
+    charge = every_n * (sample_ms * SAMPLE_MA * 1000 + sleep_s * 1000 * SLEEP_UA) + radio_ms * RADIO_MA * 1000
+    return charge / cycle_ms
+
+
+class WakePolicy:
+    def __init__(self, every_n: int = 1, temp_delta: int = 100, distance_delta: int = 50, mem=None):
+        """every_n - timer wakes per radio wake, 1 brings the radio up on every wake
+        temp_delta - centi-degrees, distance_delta - mm, 0 disables the threshold
+        mem - writable buffer for the state, by default the RTC memory wake region"""
+        self.every_n = every_n
+        self.temp_delta = temp_delta
+        self.distance_delta = distance_delta
+        self._mem = rtc_memory.region(rtc_memory.WAKE_OFFSET, rtc_memory.WAKE_SIZE) if mem is None else mem
+        magic, version, self._flags, self.wakes, self.since_radio, self._temp, self._distance, _ = struct.unpack_from(
+            _FORMAT, self._mem, 0
+        )
+        if magic != _MAGIC or version != _VERSION:
+            self._flags = self.wakes = self.since_radio = self._temp = self._distance = 0
+        self.reason = WAKE_RESET
+
+    def _store(self):
+        struct.pack_into(
+            _FORMAT,
+            self._mem,
+            0,
+            _MAGIC,
+            _VERSION,
+            self._flags,
+            self.wakes,
+            self.since_radio,
+            self._temp,
+            self._distance,
+            0,
+        )
+
+    def wake(self, reason: int):
+        """Call once per boot with wake_reason()"""
+        self.reason = reason
+        self.wakes = (self.wakes + 1) & 0xFFFFFFFF
+        if self.since_radio < 0xFFFF:
+            self.since_radio += 1
+        self._store()
+
+    def radio_first(self) -> bool:
+        """True when this wake brings up BLE regardless of the reading"""
+        return self.reason != WAKE_TIMER or self.since_radio >= self.every_n
+
+    def crossed(self, temp_raw: int, distance_mm: int) -> bool:
+        """True when a reading moved past a threshold since the radio was last up"""
+        if not self._flags & _FLAG_REFERENCE:
+            return True
+        if self.temp_delta and temp_raw != _TEMP_UNKNOWN and self._temp != _TEMP_UNKNOWN:
+            if abs(temp_raw - self._temp) >= self.temp_delta:
+                return True
+        return bool(self.distance_delta and abs(distance_mm - self._distance) >= self.distance_delta)
+
+    def radio_up(self, temp_raw: int, distance_mm: int):
+        """Call with a reading taken while the radio is up; restarts the wake count and the thresholds"""
+        self.since_radio = 0
+        self._temp = temp_raw
+        self._distance = distance_mm
+        self._flags |= _FLAG_REFERENCE
+        self._store()
+
+    def estimate_ua(self, sleep_s: int, radio_ms: int) -> float:
+        """Modelled average current of this policy, ignoring threshold wakes (see estimate_ua)"""
+        return estimate_ua(self.every_n, sleep_s, radio_ms)
@@ -6,16 +6,34 @@ import app.common as common
 
 
 # common.get_flash_info()
-common.blink_led(5, 100)
+# checked before anything else of app/ is imported, so holding both buttons recovers a broken app/ package
 check = common.check_both_buttons()
 if check:
+    import app.trace as trace
+
+    trace.begin(trace.BOOT)
+    trace.count(trace.C_WAKE)
+    from app.configuration import FAST_BOOT, ENABLE_SLEEP, ADVERTISE_EVERY_N, WAKE_TEMP_DELTA, WAKE_DISTANCE_DELTA
+    from app.wake_policy import WakePolicy, wake_reason
+
     print("No buttons are pressed")
-    common.blink_led(1, 2000)
+    if not FAST_BOOT:
+        common.blink_led(5, 100)
+        common.blink_led(1, 2000)
+    policy = WakePolicy(ADVERTISE_EVERY_N, WAKE_TEMP_DELTA, WAKE_DISTANCE_DELTA)
+    policy.wake(wake_reason())
+    # without deepsleep there is no next wake to sync on
+    radio = not ENABLE_SLEEP or policy.radio_first()
+    print(f"Wake {policy.wakes}, radio {'on' if radio else 'off'}")
+    trace.end(trace.BOOT)
+    trace.begin(trace.IMPORT)
     from app.start import BLENarmi
     import bluetooth
 
+    trace.end(trace.IMPORT)
+
     ble = bluetooth.BLE()
-    narmi = BLENarmi(ble)
+    narmi = BLENarmi(ble, policy=policy, radio=radio)
     narmi.start()
 else:
     print("Both buttons are pressed, lets update the firmware")
@@ -0,0 +1,9 @@
+# Freezes app/* into the firmware image, so it is imported from flash without compiling .py files at boot.
+# Build from the MicroPython tree (v1.24, same as MICROPYTHON/ESP32_GENERIC-SPIRAM-*.bin):
+#   cd ports/esp32
+#   make BOARD=ESP32_GENERIC BOARD_VARIANT=SPIRAM FROZEN_MANIFEST=/path/to/narmi000/src/manifest.py
+# boot.py and calibration.py stay on the filesystem.
+# sys.path looks at the filesystem before .frozen, so a copy of app/ on the device (uploaded or written by
+# the updater) still takes precedence: delete /app from the device to run the frozen modules.
+include("$(PORT_DIR)/boards/manifest.py")
+package("app", opt=3)
@@ -0,0 +1,35 @@
+# BatteryMonitor simulation with a synthetic discharge: 2000 mAh, 150 uA sleep floor, 8 mAs per wake
+#   with the unix port, from src/: micropython ../test/battery.py
+from app import rtc_memory
+from app.battery import BatteryMonitor
+
+
+class Gauge:
+    def __init__(self):
+        self.mah = 2000.0
+
+    def read_all_raw(self):
+        return 3700, int(self.mah / 2000 * 100 * 256)
+
+    def getCRate(self):
+        return -1.0
+
+capacity, sleep_ua, wake_mas = 2000, 150, 8.0
+target_days = 180
+gauge = Gauge()
+monitor = BatteryMonitor(gauge, bytearray(rtc_memory.BATTERY_SIZE))
+now, sleep_ms, days = 0, 5000, 0
+while gauge.mah > 0 and days < 400:
+    monitor.read(now=now)
+    sleep_ms = monitor.pick_sleep_ms(sleep_ms, target_days, capacity, sleep_ua, 1000, 3_600_000, now)
+    gauge.mah -= wake_mas / 3600 + sleep_ua / 1000 * sleep_ms / 3_600_000
+    now += sleep_ms // 1000 + 1
+    if now // 86400 > days:
+        days = now // 86400
+        if days % 30 == 0:
+            soc, rate = gauge.mah / capacity * 100, monitor.discharge_rate()
+            left = monitor.remaining_hours() / 24
+            print(f"day {days:>3}: SOC {soc:5.1f} %, {rate:.3f} %/h, sleep {sleep_ms // 1000} s, {left:.0f} d left")
+print(f"battery lasted {now / 86400:.0f} days for a target of {target_days}")
+assert abs(now / 86400 - target_days) < target_days * 0.1
+print("OK")
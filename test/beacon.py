@@ -0,0 +1,25 @@
+# Beacon payload check against known answers, no radio needed:
+#   on the device: mpremote run test/beacon.py
+#   with the unix port, from src/: micropython ../test/beacon.py
+import struct
+from app.aioble.ble_advertising import decode_manufacturer, decode_name
+from app.beacon import Beacon, BEACON_VERSION, BEACON_FLAG_MAC
+
+# RFC 4231 test case 2, HMAC-SHA256 truncated to the 4 bytes the beacon sends
+assert Beacon(key=b"Jefe").mac(b"what do ya want for nothing?") == bytes.fromhex("5bdcc146")
+
+# readings in record units: seq 0x1234, -5.12 C, 45.67 %RH, 1500 mm, 87 %
+adv = Beacon(b"NARMI000", b"narmi-shared-key", 0xFFFF).payload(0x1234, -512, 4567, 1500, 87)
+assert bytes(adv) == bytes.fromhex("02010609094e41524d4930303011ffffff81341200fed711dc055789abc14b"), bytes(adv).hex()
+assert len(adv) == 31 and decode_name(adv) == "NARMI000"
+company, data = decode_manufacturer(adv)
+assert company == 0xFFFF
+assert struct.unpack_from("<BHhHHB", data, 0) == (BEACON_VERSION | BEACON_FLAG_MAC, 0x1234, -512, 4567, 1500, 87)
+
+# the name is left out when it does not fit next to a MAC
+company, data = decode_manufacturer(Beacon(b"NARMI000-LONG-NAME", b"narmi-shared-key").payload(1, 0, 0, 0, 0))
+assert len(data) == 14
+# no key, no MAC
+company, data = decode_manufacturer(Beacon(b"NARMI000").payload(1, 0, 0, 0, 0))
+assert len(data) == 10 and data[0] == BEACON_VERSION
+print("Beacon OK")
@@ -0,0 +1,40 @@
+# Boot-to-advertise benchmark, run on the device:
+#   1. interrupt boot.py (Ctrl-C) and run: mpremote run test/boot_bench.py
+#   2. compare runs with FAST_BOOT on/off and with app/ frozen (src/manifest.py) or on the filesystem
+# Every reset also prints "Boot to advertise: N ms" (ticks since reset, ROM bootloader excluded).
+import sys
+import time
+import gc
+import bluetooth
+
+# forget the modules boot.py already imported, so they are loaded again
+for name in list(sys.modules):
+    if name.startswith("app") or name == "calibration":
+        del sys.modules[name]
+gc.collect()
+
+import app.trace as trace
+
+trace.clear()
+ble = bluetooth.BLE()
+ble.active(False)
+
+t0 = time.ticks_us()
+trace.begin(trace.IMPORT)
+from app.start import BLENarmi
+
+trace.end(trace.IMPORT)
+t1 = time.ticks_us()
+narmi = BLENarmi(ble)
+t2 = time.ticks_us()
+
+import_us = time.ticks_diff(t1, t0)
+advertise_us = import_us + trace.last(trace.BLE_INIT)
+print(f"import app.start: {import_us} us")
+print(f"BLENarmi until advertising: {trace.last(trace.BLE_INIT)} us")
+print(f"import to advertise: {advertise_us} us")
+print(f"sensors and history log after advertising: {time.ticks_diff(t2, t1) - trace.last(trace.BLE_INIT)} us")
+print(f"free memory: {gc.mem_free()} bytes")
+trace.dump()
+ble.gap_advertise(None)
+ble.active(False)
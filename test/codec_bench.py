@@ -0,0 +1,24 @@
+# Device.unpack benchmark: building the format string every call vs the codec cache
+#   on the device: mpremote run test/codec_bench.py
+import time
+import struct
+from app.sensor.sht40.base_sensor import Device
+
+dev = Device(None, 0x44, True)
+frame = b"\x66\x66\x93\x80\x00"
+n = 10_000
+t = time.ticks_us()
+for _ in range(n):
+    struct.unpack(dev._get_byteorder_as_str()[1] + "HBH", frame)
+before = time.ticks_diff(time.ticks_us(), t)
+t = time.ticks_us()
+for _ in range(n):
+    dev.unpack("HBH", frame)
+after = time.ticks_diff(time.ticks_us(), t)
+t = time.ticks_us()
+for _ in range(n):
+    dev.unpack_from("H", frame, 3)
+offset = time.ticks_diff(time.ticks_us(), t)
+print(f"unpack: rebuilt format {before * 1000 // n} ns, cached {after * 1000 // n} ns per call")
+print(f"unpack_from with offset: {offset * 1000 // n} ns per call")
+assert dev.pack("HBH", 0x6666, 0x93, 0x8000) == frame
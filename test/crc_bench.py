@@ -0,0 +1,35 @@
+# SHT4x CRC vectors, then the cost of checking one frame bitwise vs with the table
+#   on the device: mpremote run test/crc_bench.py
+#   with the unix port, from src/: micropython ../test/crc_bench.py
+import time
+from app.sensor.sht40.crc_mod import crc8, crc8_31, first_bad_word, VIPER
+
+try:
+    ticks_us, ticks_diff = time.ticks_us, time.ticks_diff
+except AttributeError:
+    ticks_us = lambda: int(time.perf_counter() * 1_000_000)
+    ticks_diff = lambda a, b: a - b
+
+assert crc8(bytes((1, 2, 3)), 0x31, 0xFF) == crc8_31(bytes((1, 2, 3)), 0, 3) == 0x87
+assert crc8(bytes(range(10)), 0x31, 0xFF) == crc8_31(bytes(range(10)), 0, 10) == 0x52
+frame = bytearray(b"\xbe\xef\x92\x66\x66\x00")
+frame[5] = crc8_31(frame, 3, 2)
+assert first_bad_word(frame, 0, 2) == -1
+frame[4] ^= 1
+assert first_bad_word(frame, 0, 2) == 1
+frame[4] ^= 1
+print("vectors OK, viper:", VIPER)
+
+n = 10_000
+mv = memoryview(frame)
+t = ticks_us()
+for _ in range(n):
+    if [frame[i] for i in (2, 5)] != [crc8(frame[r.start : r.stop], 0x31, 0xFF) for r in (range(2), range(3, 5))]:
+        raise ValueError
+before = ticks_diff(ticks_us(), t)
+t = ticks_us()
+for _ in range(n):
+    if first_bad_word(mv, 0, 2) >= 0:
+        raise ValueError
+after = ticks_diff(ticks_us(), t)
+print(f"SHT4x frame check: bitwise {before * 1000 // n} ns, table {after * 1000 // n} ns per frame")
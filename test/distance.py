@@ -0,0 +1,5 @@
+# HC-SR04 continuous measurement, run on the device: mpremote run test/distance.py
+from app.sensor.distance import HCSR04
+
+sensor = HCSR04(trigger_pin=26, echo_pin=25)
+sensor.continuous_measurement()
@@ -0,0 +1,36 @@
+# KeyStore check: round trip, write-on-change and lookup by index
+#   on the device: mpremote run test/keystore.py (writes and removes a file in flash)
+#   with the unix port, from src/: micropython ../test/keystore.py (uses /tmp)
+import os
+from app.keystore import KeyStore
+
+try:
+    os.stat("/tmp")
+    path = "/tmp/keystore_check.bin"
+except OSError:
+    path = "keystore_check.bin"
+
+try:
+    store = KeyStore(path)
+    store.clear()
+    store.save()
+    store.set(1, b"\x01peer-a", b"ltk-a" * 10)
+    store.set(1, b"\x01peer-b", b"ltk-b" * 10)
+    store.set(3, b"\x01peer-a", b"cccd")
+    assert store.save()
+    store.set(1, b"\x01peer-a", b"ltk-a" * 10)
+    assert not store.save(), "unchanged value was written"
+    store = KeyStore(path)
+    assert len(store) == 3 and store.get(3, b"\x01peer-a") == b"cccd"
+    assert store.get_index(1, 1) == b"ltk-b" * 10 and store.get_index(1, 2) is None
+    assert store.delete(1, b"\x01peer-a") and not store.delete(1, b"\x01peer-a")
+    assert store.get_index(1, 0) == b"ltk-b" * 10
+    store.save()
+    assert len(KeyStore(path)) == 2
+finally:
+    for name in (path, path + ".tmp"):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+print("KeyStore OK")
@@ -0,0 +1,20 @@
+# RTCRingBuffer check: decoded readings match what was appended, across wrap-around and key entries
+#   with the unix port, from src/: micropython ../test/rtc_ring.py
+#   on the device: mpremote run test/rtc_ring.py (uses a RAM buffer, the RTC backlog is not touched)
+import random
+from app import rtc_memory
+from app.rtc_ring import RTCRingBuffer, SLOT_SIZE
+
+ring = RTCRingBuffer(bytearray(rtc_memory.RING_SIZE))
+expected = []
+ts = 1000
+for i in range(2000):
+    ts += random.choice((5, 5, 5, 300))
+    reading = (ts, 2000 + random.randint(-300, 300), 5000 + random.randint(-50, 50), random.randint(0, 4000), 80)
+    expected.append((ring.append(*reading),) + reading)
+stored = list(ring)
+assert stored == expected[-len(stored) :], "decoded readings differ"
+print(f"{len(stored)} readings in {ring.capacity_slots} slots of {SLOT_SIZE} bytes")
+while len(ring):
+    assert ring.pop() == expected[-len(ring) - 1]
+print("OK")
@@ -0,0 +1,19 @@
+# Speed of sound tables against the formula, every 0.01 degree over the range, at 0, 50 and 100 %RH
+#   with the unix port, from src/: micropython ../test/sound_speed.py
+from app.sensor.sound_speed import TEMP_MIN, TEMP_MAX, reference_m_s, speed_x100, echo_to_mm
+
+worst_speed = worst_mm = 0
+for temp_raw in range(TEMP_MIN * 100, TEMP_MAX * 100 + 1):
+    for humidity_raw in (0, 5000, 10000):
+        ref = reference_m_s(temp_raw / 100, humidity_raw / 100)
+        worst_speed = max(worst_speed, abs(speed_x100(temp_raw, humidity_raw) / 100 - ref))
+        # 3 m there and back
+        echo_us = round(6000 / ref * 1000)
+        worst_mm = max(worst_mm, abs(echo_to_mm(echo_us, temp_raw, humidity_raw) - echo_us * ref / 2000))
+print(f"max speed error {worst_speed:.3f} m/s, max distance error at 3 m {worst_mm:.2f} mm")
+assert worst_speed < 0.05 and worst_mm <= 1
+fixed = 343.0
+for temp_c in (-10, 0, 20, 40):
+    error = (fixed / reference_m_s(temp_c) - 1) * 100
+    print(f"{temp_c:>4} C: {reference_m_s(temp_c):.1f} m/s, fixed 343 m/s is off by {error:+.1f} %")
+print("OK")
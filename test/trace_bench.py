@@ -0,0 +1,13 @@
+# Trace benchmark: cost of one span
+#   on the device: mpremote run test/trace_bench.py
+#   on the host, from src/: micropython ../test/trace_bench.py (or python3)
+from app.trace import begin, end, dump, ticks_us, ticks_diff, SAMPLE
+
+n = 100_000
+t = ticks_us()
+for _ in range(n):
+    begin(SAMPLE)
+    end(SAMPLE)
+elapsed = ticks_diff(ticks_us(), t)
+print(f"begin+end: {elapsed * 1000 // n} ns per span")
+dump()
@@ -0,0 +1,37 @@
+# TimeSeriesLog benchmark: append throughput and range-query latency at 1M records
+#   with the unix port, from src/: micropython ../test/tslog_bench.py [directory] [records]
+import sys
+import time
+from app.tslog import TimeSeriesLog, RECORD_SIZE
+
+try:
+    ticks_us, ticks_diff = time.ticks_us, time.ticks_diff
+except AttributeError:
+    ticks_us = lambda: int(time.perf_counter() * 1_000_000)
+    ticks_diff = lambda a, b: a - b
+
+directory = sys.argv[1] if len(sys.argv) > 1 else "tslog_bench"
+total = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+log = TimeSeriesLog(directory, segment_records=65536, max_segments=32)
+base = 700_000_000 + len(log) * 5
+t = ticks_us()
+for i in range(total):
+    log.append(base + i * 5, 2000 + i % 100, 5000, 1000 + i % 7, 80)
+log.close()
+elapsed = ticks_diff(ticks_us(), t)
+print(f"append: {total} records in {elapsed / 1e6:.2f} s, {total * 1e6 / elapsed:.0f} records/s")
+
+log = TimeSeriesLog(directory, segment_records=65536, max_segments=32)
+segments = log.segments()
+first_ts, last_ts = segments[0][1], segments[-1][2]
+buf = bytearray(RECORD_SIZE * 64)
+for label, since in (("tail 100", last_ts - 99 * 5), ("middle", (first_ts + last_ts) // 2), ("all", first_ts)):
+    t = ticks_us()
+    chunks = log.read_chunks(buf, since)
+    first_chunk = next(chunks)
+    seek_us = ticks_diff(ticks_us(), t)
+    n = first_chunk + sum(chunks)
+    elapsed = ticks_diff(ticks_us(), t)
+    assert log.count(since) == n // RECORD_SIZE
+    print(f"since {label}: first chunk after {seek_us} us, {n // RECORD_SIZE} records in {elapsed / 1000:.1f} ms")
+log.close()
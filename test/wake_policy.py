@@ -0,0 +1,28 @@
+# WakePolicy check of the radio decisions, then the placeholder power model per policy
+#   with the unix port, from src/: micropython ../test/wake_policy.py
+from app import rtc_memory
+from app.wake_policy import WakePolicy, estimate_ua, WAKE_RESET, WAKE_TIMER, WAKE_BUTTON
+
+policy = WakePolicy(every_n=3, temp_delta=100, distance_delta=50, mem=bytearray(rtc_memory.WAKE_SIZE))
+policy.wake(WAKE_RESET)
+assert policy.radio_first()
+policy.radio_up(2000, 1000)
+decisions = []
+for temp in (2010, 2020, 2030, 2040, 2200, 2210):
+    policy.wake(WAKE_TIMER)
+    radio = policy.radio_first() or policy.crossed(temp, 1000)
+    if radio:
+        policy.radio_up(temp, 1000)
+    decisions.append(radio)
+assert decisions == [False, False, True, False, True, False], decisions
+policy.wake(WAKE_BUTTON)
+assert policy.radio_first()
+state = WakePolicy(mem=policy._mem)
+assert state.wakes == policy.wakes == 8 and state.since_radio == 2
+print("OK")
+
+sleep_s, radio_ms = 300, 10_000
+base = estimate_ua(1, sleep_s, radio_ms)
+print(f"sleep {sleep_s} s, radio up {radio_ms} ms per sync, placeholder power model, relative to every wake")
+for n in (1, 2, 6, 12, 48):
+    print(f"radio every {n:>2} wakes: {estimate_ua(n, sleep_s, radio_ms) / base:5.2f}x")